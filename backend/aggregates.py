@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from ingest import MERCHANTS_TABLE, current_generation
+from storage import storage_for
+
+logger = logging.getLogger(__name__)
+
+# 按机构号预先汇总的统计表：每次上传/回滚后由 merchants 表重新计算，
+# 机构级统计只需按主键读取 institution_summary，不再扫描或分页遍历 merchants 表。
+# 交易笔数分布的分桶下界由 SUMMARY_HISTOGRAM_BUCKETS 配置（逗号分隔、递增），
+# 默认分为 0、1-9、10-99、100-999、1000+ 五档
+SUMMARY_HISTOGRAM_BUCKETS = [
+    int(edge) for edge in os.getenv("SUMMARY_HISTOGRAM_BUCKETS", "0,1,10,100,1000").split(",") if edge.strip()
+]
+
+SUMMARY_TABLE = "institution_summary"
+
+INSTITUTION_SUMMARY_DDL = f"""
+CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+    institution_id VARCHAR NOT NULL PRIMARY KEY,
+    institution VARCHAR,
+    merchants INTEGER NOT NULL,
+    total_transactions BIGINT,
+    min_transactions BIGINT,
+    max_transactions BIGINT,
+    avg_transactions DOUBLE PRECISION,
+    histogram TEXT,
+    generation INTEGER NOT NULL,
+    refreshed_at TEXT
+)
+"""
+
+_refresh_lock = threading.Lock()
+
+
+def bucket_labels(edges: List[int] = SUMMARY_HISTOGRAM_BUCKETS) -> List[str]:
+    labels = []
+    for i, low in enumerate(edges):
+        if i + 1 == len(edges):
+            labels.append(f"{low}+")
+        elif edges[i + 1] - 1 == low:
+            labels.append(str(low))
+        else:
+            labels.append(f"{low}-{edges[i + 1] - 1}")
+    return labels
+
+
+def _histogram_sql(storage, edges: List[int] = SUMMARY_HISTOGRAM_BUCKETS) -> str:
+    # 每个分桶一个 SUM(CASE ...)，组装成 {"0": n, "1-9": n, ...}，低于最小下界的笔数不计入分布
+    parts = []
+    for i, (label, low) in enumerate(zip(bucket_labels(edges), edges)):
+        condition = f"transaction_count >= {low}"
+        if i + 1 < len(edges):
+            condition += f" AND transaction_count < {edges[i + 1]}"
+        parts.append(f"'{label}', SUM(CASE WHEN {condition} THEN 1 ELSE 0 END)")
+    return storage.json_object(parts)
+
+
+def summary_generation(conn) -> Optional[int]:
+    # 汇总表对应的数据代次；表不存在或为空时返回 None，表示需要计算
+    cursor = conn.cursor()
+    try:
+        if not storage_for(conn).table_exists(cursor, SUMMARY_TABLE):
+            return None
+        cursor.execute(f"SELECT MAX(generation) FROM {SUMMARY_TABLE}")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def refresh_institution_summary(conn, generation: Optional[int] = None) -> int:
+    # 在一个事务中清空并重新计算汇总表，读取方不会看到计算到一半的结果
+    start = time.perf_counter()
+    if generation is None:
+        generation = current_generation(conn)
+    storage = storage_for(conn)
+    with _refresh_lock:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(INSTITUTION_SUMMARY_DDL)
+            storage.begin_exclusive(cursor)
+            cursor.execute(f"DELETE FROM {SUMMARY_TABLE}")
+            if storage.table_exists(cursor, MERCHANTS_TABLE):
+                cursor.execute(
+                    storage.sql(f"""
+                    INSERT INTO {SUMMARY_TABLE} (
+                        institution_id, institution, merchants, total_transactions, min_transactions,
+                        max_transactions, avg_transactions, histogram, generation, refreshed_at
+                    )
+                    SELECT institution_id, MAX(institution), COUNT(*), SUM(transaction_count),
+                           MIN(transaction_count), MAX(transaction_count), AVG(transaction_count),
+                           {_histogram_sql(storage)}, ?, ?
+                    FROM {MERCHANTS_TABLE}
+                    WHERE institution_id IS NOT NULL
+                    GROUP BY institution_id
+                    """),
+                    (generation, datetime.now().isoformat(timespec="seconds")),
+                )
+            institutions = cursor.rowcount if cursor.rowcount > 0 else 0
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    logger.info(
+        "已更新机构汇总表: 数据代次 %s, %s 个机构, 耗时 %.2fs",
+        generation, institutions, time.perf_counter() - start,
+    )
+    return institutions
+
+
+def ensure_institution_summary(conn):
+    # 汇总表落后于当前数据代次时（命令行导入、旧数据库升级等）重新计算
+    generation = current_generation(conn)
+    if summary_generation(conn) != generation:
+        refresh_institution_summary(conn, generation)
+
+
+def institution_summary(conn, institution_id: Optional[str] = None, institution: Optional[str] = None) -> dict:
+    conditions, params = [], []
+    if institution_id:
+        conditions.append("institution_id = ?")
+        params.append(institution_id)
+    if institution:
+        conditions.append("institution = ?")
+        params.append(institution)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            storage_for(conn).sql(
+                f"SELECT institution_id, institution, merchants, total_transactions, min_transactions, "
+                f"max_transactions, avg_transactions, histogram "
+                f"FROM {SUMMARY_TABLE}{where} ORDER BY institution_id"
+            ),
+            params,
+        )
+        names = [column[0] for column in cursor.description]
+        rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+    for row in rows:
+        row["histogram"] = json.loads(row["histogram"]) if row["histogram"] else {}
+        if row["avg_transactions"] is not None:
+            row["avg_transactions"] = round(row["avg_transactions"], 2)
+    return {
+        "generation": current_generation(conn),
+        "buckets": bucket_labels(),
+        "items": rows,
+        "total": len(rows),
+    }
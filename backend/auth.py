@@ -0,0 +1,151 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from executors import PoolBusy, auth_limiter
+from models import SessionLocal, UserDB, get_async_db
+from principals import AUTH_EMBED_CLAIMS, Principal, principal_cache
+
+logger = logging.getLogger(__name__)
+
+# 登录和令牌校验，两个服务共用 users 表和同一个签名密钥，签发的令牌可以互相使用
+
+# JWT配置
+SECRET_KEY = "your-secret-key"  # 在生产环境中应该使用环境变量
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+# 密码加密
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+# 默认管理员：users 表中没有该用户名时创建（backend/app 启动时、执行 init_db.py 时），
+# 密码由 ADMIN_PASSWORD 指定，未设置时使用各入口原来的默认密码
+ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str
+
+
+class TokenData(BaseModel):
+    username: Optional[str] = None
+
+
+# 密码验证
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+# 用户认证：bcrypt 校验是CPU密集操作，放到 auth 线程池执行，排队的登录请求过多时抛出 PoolBusy
+def ensure_admin_user(password: str, username: str = ADMIN_USERNAME) -> bool:
+    # 用户已存在时不做修改（不覆盖改过的密码）；多个 worker 同时启动时只有一个能插入成功
+    with SessionLocal() as db:
+        if db.query(UserDB).filter(UserDB.username == username).first() is not None:
+            return False
+        db.add(UserDB(
+            username=username,
+            email=f"{username}@example.com",
+            hashed_password=get_password_hash(password),
+            is_admin=True,
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+    logger.info("已创建管理员用户: %s", username)
+    return True
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    result = await db.execute(select(UserDB).where(UserDB.username == username))
+    user = result.scalars().first()
+    if not user:
+        return False
+    if not await auth_limiter.run(verify_password, password, user.hashed_password):
+        return False
+    return user
+
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+
+async def login(db: AsyncSession, username: str, password: str) -> dict:
+    # /token 接口的实现：校验用户名密码并签发令牌
+    try:
+        user = await authenticate_user(db, username, password)
+    except PoolBusy:
+        logger.warning("登录请求过多，拒绝本次登录")
+        raise HTTPException(status_code=429, detail="Too many login attempts, retry later", headers={"Retry-After": "1"})
+    if not user:
+        raise HTTPException(
+            status_code=401,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    claims = Principal.from_user(user).claims() if AUTH_EMBED_CLAIMS else {"sub": user.username}
+    access_token = create_access_token(
+        data=claims, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    # 同一令牌已校验过且未过期时直接返回缓存的用户（见 principals.py）
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    credentials_exception = HTTPException(
+        status_code=401,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+        token_data = TokenData(username=username)
+    except JWTError:
+        raise credentials_exception
+    # 令牌中带有用户声明时不查询数据库
+    principal = Principal.from_claims(payload)
+    if principal is None:
+        result = await db.execute(select(UserDB).where(UserDB.username == token_data.username))
+        user = result.scalars().first()
+        if user is None:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+    principal_cache.set(token, principal, payload["exp"])
+    return principal
+
+
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)):
+    return current_user
+
@@ -0,0 +1,127 @@
+import logging
+import time
+from concurrent.futures import as_completed
+from typing import List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from executors import INGEST_PROCESSES, process_pool
+from ingest import (
+    INGEST_CHUNK_SIZE, INGEST_MODE, MERCHANT_FIELDS, IngestError, IngestStats,
+    iter_chunks, iter_excel_batches, list_sheets, load_chunks,
+)
+from metrics import observe_phase
+
+logger = logging.getLogger(__name__)
+
+
+class BatchStats(IngestStats):
+    # 批量导入的统计：合并后写入的行数/耗时，以及每个工作表的解析情况
+    def __init__(self, stats: IngestStats, sources: List[dict], duplicates: int, parse_seconds: float):
+        super().__init__(stats.rows, parse_seconds + stats.seconds, stats.generation)
+        self.sources = sources
+        self.duplicates = duplicates
+        self.parse_seconds = parse_seconds
+        self.load_seconds = stats.seconds
+        # 增量导入时带上新增/更新/删除行数
+        if hasattr(stats, "changes"):
+            self.changes = stats.changes
+
+    def as_dict(self):
+        result = super().as_dict()
+        result.update({
+            "parse_seconds": round(self.parse_seconds, 3),
+            "load_seconds": round(self.load_seconds, 3),
+            "duplicates": self.duplicates,
+            "sources": self.sources,
+        })
+        result.update(getattr(self, "changes", {}))
+        return result
+
+
+def list_sources(files: Sequence[Tuple[str, str]], sheets: Optional[Sequence[str]] = None) -> List[dict]:
+    # files 为 (本地路径, 显示名称)。未指定工作表时导入每个文件的全部工作表，并跳过完全空白的工作表
+    sources = []
+    for path, name in files:
+        for sheet in (sheets or list_sheets(path)):
+            sources.append({"path": path, "file": name, "sheet": sheet, "skip_empty": not sheets})
+    return sources
+
+
+def source_label(source: dict) -> str:
+    return f"{source['file']} [{source['sheet']}]"
+
+
+def parse_source(source: dict, chunk_size: int = INGEST_CHUNK_SIZE):
+    # 在子进程中执行：读取、校验一个工作表，返回转换后的 DataFrame 和耗时
+    start = time.perf_counter()
+    try:
+        frames = [
+            pd.DataFrame.from_records(batch, columns=MERCHANT_FIELDS)
+            for batch in iter_excel_batches(source["path"], chunk_size, source["sheet"], source["skip_empty"])
+        ]
+    except IngestError as e:
+        raise IngestError(f"{source_label(source)}: {e}")
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=MERCHANT_FIELDS)
+    return frame, time.perf_counter() - start
+
+
+def parse_sources(sources: List[dict], processes: int = INGEST_PROCESSES, chunk_size: int = INGEST_CHUNK_SIZE,
+                  progress=None) -> List[Tuple[pd.DataFrame, float]]:
+    # 多个工作表在子进程中并行解析，结果按输入顺序返回
+    results = [None] * len(sources)
+    parsed_rows = 0
+    pool = process_pool(max(1, min(processes, len(sources))))
+    try:
+        futures = {pool.submit(parse_source, source, chunk_size): i for i, source in enumerate(sources)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            parsed_rows += len(results[i][0])
+            logger.info("已解析 %s: %s 条, 耗时 %.2fs", source_label(sources[i]), len(results[i][0]), results[i][1])
+            if progress is not None:
+                progress("parsing", parsed_rows)
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return results
+
+
+def merge_frames(sources: List[dict], results) -> Tuple[pd.DataFrame, List[dict], int]:
+    # 按商户号去重：同一商户号出现多次时保留输入顺序中最后一条（后面的文件/工作表覆盖前面的）
+    frames = [frame.assign(source=i) for i, (frame, _) in enumerate(results) if len(frame)]
+    if not frames:
+        raise IngestError("No merchant rows found in the uploaded files")
+    merged = pd.concat(frames, ignore_index=True)
+    duplicated = merged.duplicated("merchant_id", keep="last")
+    superseded = merged.loc[duplicated, "source"].value_counts()
+
+    report = [
+        {
+            "file": source["file"],
+            "sheet": source["sheet"],
+            "rows": len(frame),
+            "superseded": int(superseded.get(i, 0)),
+            "seconds": round(seconds, 3),
+        }
+        for i, (source, (frame, seconds)) in enumerate(zip(sources, results))
+    ]
+    return merged[~duplicated], report, int(duplicated.sum())
+
+
+def load_batch(conn, sources: List[dict], processes: int = INGEST_PROCESSES, chunk_size: int = INGEST_CHUNK_SIZE,
+               mode: str = INGEST_MODE, progress=None, data_date: Optional[str] = None) -> BatchStats:
+    # 并行解析全部工作表，去重合并后一次性写入，与单文件上传一样原子替换线上数据
+    if not sources:
+        raise IngestError("No worksheets to import")
+    start = time.perf_counter()
+    results = parse_sources(sources, processes, chunk_size, progress)
+    merged, report, duplicates = merge_frames(sources, results)
+    parse_seconds = time.perf_counter() - start
+    observe_phase("parse", parse_seconds)
+    logger.info(
+        "解析完成: %s 个工作表, 合并后 %s 条, 重复商户号 %s 条, 耗时 %.2fs",
+        len(sources), len(merged), duplicates, parse_seconds,
+    )
+
+    stats = load_chunks(conn, iter_chunks(merged, chunk_size), mode, progress, data_date)
+    return BatchStats(stats, report, duplicates, parse_seconds)
@@ -0,0 +1,463 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 端到端基准测试：生成合成的 未月活-MMDD.xlsx，经 TestClient 上传并压测主要查询，结果写成 JSON 便于对比：
+#   python bench.py generate --rows 100000
+#   python bench.py run --rows 10000 100000 --target main --target app --output bench-0427.json
+#   python bench.py compare bench-0427.json bench-0501.json
+# 每个目标（main 为 backend/main.py，app 为 backend/app/main.py）在单独的子进程和临时目录中运行，
+# 峰值内存互不影响，也不会改动当前目录下的数据库。默认使用临时 SQLite 数据库；
+# --database-url 指定 PostgreSQL 时 main 使用该库（库中的数据会被覆盖），app 只支持 SQLite。
+# 其他配置（RESULT_CACHE_SIZE、QUERY_ENGINE、INGEST_MODE 等）沿用当前环境变量，并记录在结果中
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# 目标应用与登录用户（两个应用共用 users 表）
+TARGETS = {
+    "main": (os.path.join(BACKEND_DIR, "main.py"), "admin", "admin123"),
+    "app": (os.path.join(BACKEND_DIR, "app", "main.py"), "admin", "admin123"),
+}
+RESULT_VERSION = 1
+
+# 单个工作表最多 1048576 行（含表头），超出时拆成多个工作表，只有 main 的批量导入能读取全部工作表
+SHEET_MAX_ROWS = 1048575
+
+# 结果中记录的配置项前缀
+CONFIG_ENV_PREFIXES = (
+    "DATABASE_", "SQLITE_", "READ_POOL", "INGEST_", "RESULT_CACHE_", "QUERY_ENGINE", "JSON_RESPONSE_MODE",
+    "METRICS_", "AUTH_", "EXPORT_", "BATCH_LOOKUP_",
+)
+
+# 合成数据：宿州周边的地名 + 字号/姓氏 + 经营类型，经营类型对应 MCC
+REGIONS = ["宿州市", "埇桥区", "砀山县", "萧县", "灵璧县", "泗县", "蚌埠市", "淮北市", "濉溪县", "固镇县"]
+BRANDS = ["鑫源", "好又多", "佳佳", "兴隆", "顺发", "家和", "福满", "永盛", "华联", "金鼎", "聚宝", "恒通",
+          "惠民", "诚信", "天天", "乐购", "百姓", "红星", "富强", "新世纪"]
+SURNAMES = ["王", "李", "张", "刘", "陈", "杨", "赵", "黄", "周", "吴", "徐", "孙", "胡", "朱", "高", "林"]
+GIVEN_NAMES = ["伟", "芳", "娜", "敏", "静", "强", "磊", "军", "洋", "勇", "艳", "杰", "涛", "明", "超", "霞"]
+SHOP_TYPES = [
+    ("理发店", "7230"), ("便利店", "5499"), ("超市", "5411"), ("水果店", "5499"), ("餐馆", "5812"),
+    ("小吃店", "5814"), ("五金店", "5251"), ("药店", "5912"), ("服装店", "5651"), ("烟酒店", "5993"),
+    ("手机店", "4812"), ("美容院", "7298"), ("面馆", "5812"), ("建材店", "5211"), ("农资店", "5261"),
+]
+TOWNS = ["杨庄", "朱仙庄", "符离", "夹沟", "曹村", "栏杆", "大店", "灰古", "大泽乡", "桃园", "蒿沟", "永安",
+         "顺河", "北杨寨", "芦岭", "褚兰", "西寺坡", "支河", "城东", "城西", "汴河", "三八", "沱河", "道东"]
+BRANCH_TYPES = ["支行", "分理处", "营业所", "信用社"]
+
+
+def make_institutions(count: int) -> List[tuple]:
+    # (机构, 机构号)，机构号为 10 位数字
+    names = [f"{town}{branch}" for branch in BRANCH_TYPES for town in TOWNS]
+    if count > len(names):
+        names += [f"{TOWNS[i % len(TOWNS)]}{i // len(TOWNS)}号网点" for i in range(len(names), count)]
+    return [(names[i], str(3411463930 + i)) for i in range(count)]
+
+
+def merchant_name(rng: random.Random, shop_type: str) -> str:
+    region = rng.choice(REGIONS)
+    if rng.random() < 0.5:
+        owner = rng.choice(BRANDS)
+    elif rng.random() < 0.5:
+        owner = f"{rng.choice(SURNAMES)}记"
+    else:
+        owner = f"{rng.choice(SURNAMES)}{rng.choice(GIVEN_NAMES)}"
+    return f"{region}{owner}{shop_type}"
+
+
+def generate_dataset(path: str, rows: int, seed: int = 0, institutions: int = 80, skew: float = 1.1) -> dict:
+    # 机构按 Zipf 分布（第 k 个机构的权重为 1/k^skew），少数机构占大多数商户；
+    # 未月活商户的交易笔数大多为 0，其余按指数分布递减。返回数据集说明，查询取值也从中选取
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    institution_list = make_institutions(institutions)
+    cum_weights, total = [], 0.0
+    for k in range(1, institutions + 1):
+        total += 1 / k ** skew
+        cum_weights.append(total)
+    indexes = range(institutions)
+    sample_every = max(rows // 100, 1)
+    sample_ids, counts = [], [0] * institutions
+
+    workbook = Workbook(write_only=True)
+    worksheet, sheets = None, []
+    for i in range(rows):
+        if i % SHEET_MAX_ROWS == 0:
+            sheets.append(f"数据{len(sheets) + 1}")
+            worksheet = workbook.create_sheet(sheets[-1])
+            worksheet.append(["商户号", "商户名称", "机构", "机构号", "有效交易笔数"])
+        institution = rng.choices(indexes, cum_weights=cum_weights)[0]
+        counts[institution] += 1
+        shop_type, mcc = rng.choice(SHOP_TYPES)
+        merchant_id = f"834{mcc}{i:08d}"
+        transactions = 0 if rng.random() < 0.6 else int(rng.expovariate(0.5)) + 1
+        name, institution_id = institution_list[institution]
+        worksheet.append([merchant_id, merchant_name(rng, shop_type), name, institution_id, transactions])
+        if i % sample_every == 0:
+            sample_ids.append(merchant_id)
+    workbook.save(path)
+
+    ranked = sorted(range(institutions), key=lambda k: counts[k], reverse=True)
+    ranked = [k for k in ranked if counts[k]]
+    return {
+        "rows": rows,
+        "seed": seed,
+        "institutions": institutions,
+        "skew": skew,
+        "sheets": sheets,
+        "file_bytes": os.path.getsize(path),
+        "top_institutions": [[*institution_list[k], counts[k]] for k in ranked[:5]],
+        "tail_institutions": [[*institution_list[k], counts[k]] for k in ranked[-5:]],
+        "sample_merchant_ids": sample_ids,
+    }
+
+
+def ensure_dataset(data_dir: str, rows: int, seed: int, date: str, institutions: int, skew: float) -> tuple:
+    # 同样参数的数据集只生成一次，说明写在同目录的 dataset.json 中
+    directory = os.path.join(os.path.abspath(data_dir), f"{rows}-{seed}-{institutions}-{skew}")
+    path = os.path.join(directory, f"未月活-{date}.xlsx")
+    meta_path = os.path.join(directory, "dataset.json")
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            return path, json.load(f)
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    meta = generate_dataset(path, rows, seed, institutions, skew)
+    meta["generate_seconds"] = round(time.perf_counter() - start, 3)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"已生成 {path}：{rows} 行，{meta['file_bytes'] / 1024 / 1024:.1f}MB，耗时 {meta['generate_seconds']:.1f}s")
+    return path, meta
+
+
+def query_shapes(meta: dict) -> Dict[str, List[dict]]:
+    # 每种查询形态给出若干组参数，压测时轮流使用，避免全部命中同一条结果缓存
+    top = [institution[1] for institution in meta["top_institutions"]]
+    tail = [institution[1] for institution in meta["tail_institutions"]]
+    names = [institution[0] for institution in meta["top_institutions"]]
+    ids = meta["sample_merchant_ids"]
+    middle_page = max(meta["rows"] // 20 // 2, 1)
+    return {
+        "first_page": [{}],
+        "institution_id_top": [{"institution_id": value} for value in top],
+        "institution_id_tail": [{"institution_id": value} for value in tail],
+        "institution_name": [{"institution": value} for value in names],
+        "merchant_id": [{"merchant_id": value} for value in ids],
+        "merchant_name": [{"merchant_name": f"{brand}{shop_type}"} for brand in BRANDS[:5] for shop_type, _ in SHOP_TYPES[:3]],
+        "merchant_name_short": [{"merchant_name": shop_type[:2]} for shop_type, _ in SHOP_TYPES],
+        "deep_page": [{"page": middle_page + offset, "page_size": 20} for offset in range(5)],
+        "large_page": [{"institution_id": value, "page_size": 1000} for value in top],
+    }
+
+
+def percentile(values: List[float], q: float) -> float:
+    # 线性插值，与 numpy.percentile 默认方式一致
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(timings: List[float]) -> dict:
+    milliseconds = [t * 1000 for t in timings]
+    return {
+        "count": len(milliseconds),
+        "p50_ms": round(percentile(milliseconds, 50), 3),
+        "p99_ms": round(percentile(milliseconds, 99), 3),
+        "mean_ms": round(sum(milliseconds) / len(milliseconds), 3),
+        "max_ms": round(max(milliseconds), 3),
+    }
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss 在 Linux 上以 KB 为单位，macOS 上以字节为单位
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def load_target(target: str):
+    path = TARGETS[target][0]
+    sys.path.insert(0, BACKEND_DIR)
+    # 两个应用共用 users 表，默认管理员由 init_db 创建
+    from init_db import create_admin_user
+    create_admin_user()
+    if target == "main":
+        import main
+        return main.app
+    spec = importlib.util.spec_from_file_location("app_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def upload(client, target: str, path: str, sheets: List[str], headers: dict) -> dict:
+    # main 的上传为后台任务，轮询到任务结束为止；app 在请求内同步导入
+    filename = os.path.basename(path)
+    with open(path, "rb") as f:
+        if target == "main" and len(sheets) > 1:
+            response = client.post("/api/upload/batch", files=[("files", (filename, f))], headers=headers)
+        else:
+            response = client.post("/api/upload/", files={"file": (filename, f)}, headers=headers)
+    if target == "app":
+        if response.status_code != 200:
+            raise RuntimeError(f"上传失败: {response.status_code} {response.text}")
+        return response.json()
+    if response.status_code != 202:
+        raise RuntimeError(f"上传失败: {response.status_code} {response.text}")
+    job_id = response.json()["job_id"]
+    while True:
+        job = client.get(f"/api/upload/{job_id}", headers=headers).json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            break
+        time.sleep(0.05)
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"上传任务 {job['status']}: {job.get('error')}")
+    return job
+
+
+def run_worker(args) -> int:
+    # 在子进程中运行：导入目标应用、上传数据集、压测查询，结果写入 args.result
+    with open(args.dataset_meta, encoding="utf-8") as f:
+        meta = json.load(f)
+    result = {"target": args.target, "rows": meta["rows"]}
+
+    start = time.perf_counter()
+    app = load_target(args.target)
+    from fastapi.testclient import TestClient
+    # 进入上下文后所有请求在同一个事件循环中执行（asyncpg 连接不能跨事件循环使用）
+    with TestClient(app) as client:
+        result["startup_seconds"] = round(time.perf_counter() - start, 3)
+        result["rss_after_startup_mb"] = peak_rss_mb()
+        _, username, password = TARGETS[args.target]
+        token = client.post("/token", data={"username": username, "password": password}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        start = time.perf_counter()
+        upload_result = upload(client, args.target, args.dataset, meta["sheets"], headers)
+        seconds = time.perf_counter() - start
+        result["ingest"] = {
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(meta["rows"] / seconds, 1),
+            "reported_rows_per_second": upload_result.get("rows_per_second"),
+            "reported_seconds": upload_result.get("elapsed_seconds"),
+        }
+        result["peak_rss_after_ingest_mb"] = peak_rss_mb()
+
+        shapes = query_shapes(meta)
+        timings = {name: [] for name in shapes}
+        cold, errors = {}, {}
+        for name, variants in shapes.items():
+            # 每种形态的第一次请求单独记录（缓存未命中），不计入分位数
+            start = time.perf_counter()
+            response = client.get("/api/merchants/", params=variants[0])
+            cold[name] = round((time.perf_counter() - start) * 1000, 3)
+            if response.status_code != 200:
+                errors[name] = f"{response.status_code} {response.text[:200]}"
+        for i in range(args.repeat):
+            for name, variants in shapes.items():
+                if name in errors:
+                    continue
+                start = time.perf_counter()
+                response = client.get("/api/merchants/", params=variants[i % len(variants)])
+                timings[name].append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors[name] = f"{response.status_code} {response.text[:200]}"
+        result["queries"] = {
+            name: {"cold_ms": cold[name], **latency_summary(values)} for name, values in timings.items() if values
+        }
+        if errors:
+            result["query_errors"] = errors
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    # 批量导入时并行解析的子进程
+    result["peak_children_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    return 0
+
+
+def git_revision() -> Optional[str]:
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def package_versions() -> dict:
+    from importlib.metadata import PackageNotFoundError, version
+    versions = {}
+    for name in ("fastapi", "starlette", "sqlalchemy", "openpyxl", "pandas", "orjson", "aiosqlite", "asyncpg"):
+        try:
+            versions[name] = version(name)
+        except PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def run_target(target: str, path: str, meta_path: str, repeat: int, database_url: Optional[str], keep: bool) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench_{target}_")
+    env = dict(os.environ)
+    env.pop("DATABASE_PATH", None)
+    env.pop("DATABASE_URL", None)
+    if database_url and target == "main":
+        env["DATABASE_URL"] = database_url
+    result_path = os.path.join(workdir, "result.json")
+    log_path = os.path.join(workdir, "bench.log")
+    command = [sys.executable, os.path.abspath(__file__), "worker", "--target", target, "--dataset", path,
+               "--dataset-meta", meta_path, "--repeat", str(repeat), "--result", result_path]
+    try:
+        with open(log_path, "w", encoding="utf-8") as log:
+            completed = subprocess.run(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            with open(log_path, encoding="utf-8", errors="replace") as f:
+                tail = f.read()[-2000:]
+            return {"target": target, "error": f"exit code {completed.returncode}", "log_tail": tail}
+        with open(result_path, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        if keep:
+            print(f"保留工作目录: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_result(result: dict):
+    if "error" in result or "skipped" in result:
+        print(f"[{result['target']}] {result['rows']} 行: {result.get('error') or result.get('skipped')}")
+        return
+    ingest = result["ingest"]
+    print(
+        f"[{result['target']}] {result['rows']} 行: 导入 {ingest['seconds']:.2f}s（{ingest['rows_per_second']:.0f} 行/秒），"
+        f"峰值内存 {result['peak_rss_mb']:.0f}MB"
+    )
+    for name, summary in result["queries"].items():
+        print(f"  {name:<22} p50 {summary['p50_ms']:8.2f}ms  p99 {summary['p99_ms']:8.2f}ms  首次 {summary['cold_ms']:8.2f}ms")
+    for name, error in result.get("query_errors", {}).items():
+        print(f"  {name:<22} 失败: {error}")
+
+
+def run(args) -> int:
+    targets = args.targets or list(TARGETS)
+    report = {
+        "version": RESULT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": package_versions(),
+        "env": {key: value for key, value in sorted(os.environ.items()) if key.startswith(CONFIG_ENV_PREFIXES)},
+        "database_url": args.database_url,
+        "repeat": args.repeat,
+        "datasets": {},
+        "results": [],
+    }
+    for rows in args.rows:
+        path, meta = ensure_dataset(args.data_dir, rows, args.seed, args.date, args.institutions, args.skew)
+        report["datasets"][str(rows)] = {key: value for key, value in meta.items() if key != "sample_merchant_ids"}
+        meta_path = os.path.join(os.path.dirname(path), "dataset.json")
+        for target in targets:
+            if target == "app" and len(meta["sheets"]) > 1:
+                result = {"target": target, "rows": rows, "skipped": "app 只导入第一个工作表"}
+            else:
+                result = run_target(target, path, meta_path, args.repeat, args.database_url, args.keep)
+                result["rows"] = rows
+            report["results"].append(result)
+            print_result(result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    return 1 if any("error" in result for result in report["results"]) else 0
+
+
+def compare(args) -> int:
+    # 按 目标 + 行数 对齐两次结果，比较导入速度和各查询形态的 p50/p99（比值 >1 表示变慢）
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    print(f"基准: {baseline.get('git_revision')} ({baseline['created_at']})")
+    print(f"当前: {current.get('git_revision')} ({current['created_at']})")
+    previous = {(result["target"], result["rows"]): result for result in baseline["results"]}
+    for result in current["results"]:
+        before = previous.get((result["target"], result["rows"]))
+        if before is None or "ingest" not in result or "ingest" not in before:
+            continue
+        print(
+            f"[{result['target']}] {result['rows']} 行: 导入 {before['ingest']['rows_per_second']:.0f} -> "
+            f"{result['ingest']['rows_per_second']:.0f} 行/秒，峰值内存 {before['peak_rss_mb']:.0f} -> "
+            f"{result['peak_rss_mb']:.0f}MB"
+        )
+        for name, summary in result["queries"].items():
+            old = before["queries"].get(name)
+            if old is None:
+                continue
+            print(
+                f"  {name:<22} p50 {old['p50_ms']:8.2f} -> {summary['p50_ms']:8.2f}ms ({summary['p50_ms'] / old['p50_ms']:.2f}x)  "
+                f"p99 {old['p99_ms']:8.2f} -> {summary['p99_ms']:8.2f}ms ({summary['p99_ms'] / old['p99_ms']:.2f}x)"
+            )
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="商户查询服务端到端基准测试")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_dataset_options(command):
+        command.add_argument("--rows", type=int, nargs="+", default=[10000], help="数据集行数，可指定多个")
+        command.add_argument("--seed", type=int, default=0, help="随机种子")
+        command.add_argument("--institutions", type=int, default=80, help="机构数量")
+        command.add_argument("--skew", type=float, default=1.1, help="机构分布的 Zipf 指数，越大越集中")
+        command.add_argument("--date", default="0427", help="文件名中的日期 MMDD")
+        command.add_argument("--data-dir", default="bench_data", help="数据集目录，已生成的数据集会复用")
+
+    generate = commands.add_parser("generate", help="只生成数据集")
+    add_dataset_options(generate)
+
+    run_command = commands.add_parser("run", help="生成数据集并运行基准测试")
+    add_dataset_options(run_command)
+    run_command.add_argument("--target", action="append", dest="targets", choices=list(TARGETS),
+                             help="要测试的应用，可重复指定；默认全部")
+    run_command.add_argument("--repeat", type=int, default=100, help="每种查询形态请求的次数")
+    run_command.add_argument("--database-url", help="main 使用的数据库 URL（数据会被覆盖），默认临时 SQLite")
+    run_command.add_argument("--output", default="bench-results.json", help="结果 JSON 文件")
+    run_command.add_argument("--keep", action="store_true", help="保留每个目标的临时工作目录和日志")
+
+    compare_command = commands.add_parser("compare", help="对比两次运行结果")
+    compare_command.add_argument("baseline", help="基准结果 JSON")
+    compare_command.add_argument("current", help="当前结果 JSON")
+
+    worker = commands.add_parser("worker")
+    worker.add_argument("--target", choices=list(TARGETS), required=True)
+    worker.add_argument("--dataset", required=True)
+    worker.add_argument("--dataset-meta", required=True)
+    worker.add_argument("--repeat", type=int, required=True)
+    worker.add_argument("--result", required=True)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        for rows in args.rows:
+            ensure_dataset(args.data_dir, rows, args.seed, args.date, args.institutions, args.skew)
+        return 0
+    if args.command == "run":
+        return run(args)
+    if args.command == "compare":
+        return compare(args)
+    return run_worker(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
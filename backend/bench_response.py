@@ -0,0 +1,107 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# 对比分页查询两种 JSON 响应方式的输出和耗时：
+#   python bench_response.py --page-size 1000 --repeat 200
+# pydantic：按 response_model=PaginatedResponse 校验并序列化（FastAPI 默认方式）；
+# orjson：ORJSONResponse 直接序列化（responses.json_response 的默认方式）。
+# 两种方式的响应体必须逐字节相同，否则退出码为 1。
+# 在临时目录中导入 main，不会改动当前目录下的数据库文件
+
+# 覆盖需要转义或多字节编码的字符
+SAMPLE_NAMES = ["宿州市理发店", 'say "hi"', "back\\slash", "tab\tnew\nline", "ctrl\x01\x1f", "emoji 😀", " sep"]
+
+
+def make_payload(page_size: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    items = [
+        {
+            "merchant_id": str(10 ** 14 + i),
+            "merchant_name": f"{rng.choice(SAMPLE_NAMES)}{i}",
+            "institution": f"杨庄{i % 7}",
+            "institution_id": str(3411463930 + i % 7),
+            "transaction_count": rng.randint(0, 10 ** 6),
+        }
+        for i in range(page_size)
+    ]
+    return {
+        "items": items,
+        "total": page_size * 10,
+        "page": 1,
+        "page_size": page_size,
+        "total_pages": 10,
+        "data_date": "4月27日",
+        "next_cursor": None,
+    }
+
+
+def build_app(payload: dict):
+    from fastapi import FastAPI
+    from fastapi.responses import ORJSONResponse
+
+    from main import PaginatedResponse
+
+    app = FastAPI()
+
+    @app.get("/pydantic", response_model=PaginatedResponse)
+    async def pydantic_page():
+        return payload
+
+    @app.get("/orjson", response_model=PaginatedResponse)
+    async def orjson_page():
+        return ORJSONResponse(payload)
+
+    return app
+
+
+def measure(client, path: str, repeat: int):
+    timings = []
+    body = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - start)
+        body = response.content
+    return body, timings
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="对比分页查询的 Pydantic 与 orjson 响应方式")
+    parser.add_argument("--page-size", type=int, default=1000, help="每页条数")
+    parser.add_argument("--repeat", type=int, default=100, help="每种方式请求的次数")
+    args = parser.parse_args(argv)
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_response_"))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from fastapi.testclient import TestClient
+
+    payload = make_payload(args.page_size)
+    client = TestClient(build_app(payload))
+    results = {}
+    for mode in ("pydantic", "orjson"):
+        # 预热一次，不计入耗时
+        client.get(f"/{mode}")
+        results[mode] = measure(client, f"/{mode}", args.repeat)
+
+    for mode, (body, timings) in results.items():
+        print(
+            f"{mode:>8}: 中位数 {statistics.median(timings) * 1000:.2f}ms, "
+            f"平均 {statistics.mean(timings) * 1000:.2f}ms, 响应 {len(body)} 字节"
+        )
+    speedup = statistics.median(results["pydantic"][1]) / statistics.median(results["orjson"][1])
+    print(f"page_size={args.page_size}: orjson 快 {speedup:.1f} 倍")
+
+    if results["pydantic"][0] != results["orjson"][0]:
+        print("响应内容不一致", file=sys.stderr)
+        return 1
+    print("响应内容一致")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import text
+
+from ingest import DEFAULT_DATA_DATE
+
+logger = logging.getLogger(__name__)
+
+# 查询结果缓存配置：
+# RESULT_CACHE_BACKEND=memory 每个 worker 独立的 LRU；sqlite 多个 worker 共享同一个缓存文件；none 关闭
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "result_cache.db")
+
+
+def get_generation(db) -> int:
+    # 当前数据代次，每次上传/回滚提交时加一，用于精确地让缓存失效
+    result = db.execute(text("SELECT generation FROM data_generation WHERE id = 1")).fetchone()
+    return result[0] if result else 0
+
+
+class DataDateCache:
+    # 当前数据日期，按数据代次缓存在进程内。数据日期与数据代次在同一事务中更新（见 ingest._publish_generation），
+    # 代次不变时日期一定不变，不需要再查询 data_date 表；其他进程上传后代次变化，下次读取时自动刷新
+
+    def __init__(self, default: str = DEFAULT_DATA_DATE):
+        self.default = default
+        self._lock = threading.Lock()
+        self._generation = None
+        self._value = None
+
+    def get(self, db, generation: int) -> str:
+        return self.stored(db, generation) or self.default
+
+    def stored(self, db, generation: int) -> Optional[str]:
+        # data_date 表中的日期，还没有上传过带日期的文件时为 None
+        with self._lock:
+            if self._generation == generation:
+                return self._value
+        result = db.execute(text("SELECT date FROM data_date WHERE id = 1")).fetchone()
+        value = result[0] if result and result[0] else None
+        self.publish(generation, value)
+        return value
+
+    def publish(self, generation: int, value: Optional[str]):
+        # 上传提交后由上传所在进程直接写入，本进程不必等下一次读取
+        with self._lock:
+            if self._generation is None or generation >= self._generation:
+                self._generation = generation
+                self._value = value
+
+
+data_date_cache = DataDateCache()
+
+
+def make_key(endpoint: str, **params) -> str:
+    # 规范化查询参数：去掉未传的参数，按名称排序。空字符串保留，cursor="" 表示游标分页的第一页，
+    # 与不传 cursor 的偏移分页是不同的请求
+    normalized = {name: value for name, value in params.items() if value is not None}
+    return endpoint + "?" + json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+class ResultCache:
+    # 进程内 LRU + TTL 缓存，条目记录写入时的数据代次，代次变化后整体失效
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = None
+
+    def get(self, key: str, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                self._reset(generation)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, generation: int, value):
+        with self._lock:
+            if generation != self._generation:
+                self._reset(generation)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _reset(self, generation: int):
+        if self._entries:
+            logger.info("数据代次变为 %s，清空查询缓存 %s 条", generation, len(self._entries))
+        self._entries.clear()
+        self._generation = generation
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "backend": "memory",
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "generation": self._generation,
+        }
+
+
+class SqliteResultCache(ResultCache):
+    # 多个 gunicorn worker 共享的缓存，存放在独立的 SQLite 文件中，不占用 merchants.db 的写锁；
+    # 命中/未命中计数为当前 worker 的统计
+
+    DDL = """
+    CREATE TABLE IF NOT EXISTS result_cache (
+        key TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL,
+        expires_at REAL NOT NULL,
+        last_used REAL NOT NULL,
+        value TEXT NOT NULL
+    )
+    """
+
+    def __init__(self, path: str = RESULT_CACHE_PATH, maxsize: int = RESULT_CACHE_SIZE,
+                 ttl: float = RESULT_CACHE_TTL):
+        super().__init__(maxsize, ttl)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(self.DDL)
+
+    def get(self, key: str, generation: int):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generation, expires_at, value FROM result_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[0] != generation or row[1] < now:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE result_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[2])
+
+    def set(self, key: str, generation: int, value):
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, generation, expires_at, last_used, value) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, generation, now + self.ttl, now, payload),
+            )
+            # 删除旧代次的条目，超出容量时按最近使用时间淘汰
+            self._conn.execute("DELETE FROM result_cache WHERE generation != ?", (generation,))
+            size = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+            if size > self.maxsize:
+                self._conn.execute(
+                    "DELETE FROM result_cache WHERE key IN "
+                    "(SELECT key FROM result_cache ORDER BY last_used LIMIT ?)",
+                    (size - self.maxsize,),
+                )
+                self.evictions += size - self.maxsize
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM result_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM result_cache").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class NullCache(ResultCache):
+    def get(self, key: str, generation: int):
+        self.misses += 1
+        return None
+
+    def set(self, key: str, generation: int, value):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "none", "hits": 0, "misses": self.misses, "evictions": 0}
+
+
+def create_result_cache() -> ResultCache:
+    if RESULT_CACHE_BACKEND == "sqlite":
+        return SqliteResultCache()
+    if RESULT_CACHE_BACKEND == "none":
+        return NullCache()
+    return ResultCache()
+
+
+result_cache = create_result_cache()
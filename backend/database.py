@@ -0,0 +1,137 @@
+import logging
+import os
+import sqlite3
+from typing import List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from metrics import instrument_engine
+from storage import DATABASE_PATH, DATABASE_URL, backend_name
+
+logger = logging.getLogger(__name__)
+
+# 数据库连接统一在这里创建和配置（数据库由 DATABASE_URL 决定，见 storage.py）：
+# - 写入（上传、回滚、建表、汇总表刷新）只经过唯一的写连接，写操作在进程内排队，不会互相抢锁；
+# - 查询使用只读连接池（每个 worker 进程各自一份），连接和页缓存复用，不再每个请求重新打开；
+# - SQLite 使用 WAL 模式，读不阻塞写、写也不阻塞读，上传期间查询照常返回上一代数据
+DATABASE_BACKEND = backend_name(DATABASE_URL)
+
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+# WAL 下 NORMAL 只在检查点时 fsync，掉电最多丢失最近提交的事务，不会损坏数据库
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# 负数表示 KiB，每个连接默认 32MB 页缓存
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-32768"))
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+# 连接池大小（PostgreSQL 同样适用）
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", str(SQLITE_READ_POOL_SIZE)))
+
+
+def pragmas(readonly: bool = False) -> List[str]:
+    statements = [
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        f"PRAGMA temp_store={SQLITE_TEMP_STORE}",
+    ]
+    if readonly:
+        # 只读连接误执行写操作时直接报错，而不是去抢写锁
+        statements.append("PRAGMA query_only=ON")
+    else:
+        # journal_mode 记录在数据库文件中，由写连接设置一次即可
+        statements.insert(0, f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    return statements
+
+
+def configure_connection(conn, readonly: bool = False):
+    # conn 为 DB-API 连接：sqlite3，或 SQLAlchemy 包装的 aiosqlite 连接
+    cursor = conn.cursor()
+    try:
+        for statement in pragmas(readonly):
+            cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+def connect(path: str = DATABASE_PATH, readonly: bool = False, **kwargs) -> sqlite3.Connection:
+    # 供命令行工具使用的 sqlite3 连接，pragma 与服务端连接一致
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, **kwargs)
+    configure_connection(conn, readonly)
+    return conn
+
+
+def _on_connect(readonly: bool):
+    def listener(dbapi_connection, connection_record):
+        configure_connection(dbapi_connection, readonly)
+    return listener
+
+
+def _sync_url(url: str):
+    # storage.py 的批量写入使用 psycopg2 的 copy_expert，未指定驱动时固定为 psycopg2
+    url = make_url(url)
+    if url.drivername == "postgresql":
+        url = url.set(drivername="postgresql+psycopg2")
+    return url
+
+
+def _create_engines(url: str):
+    if backend_name(url) == "sqlite":
+        connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}
+        read_args = connect_args
+        async_url = make_url(url).set(drivername="sqlite+aiosqlite")
+        async_args = {"timeout": SQLITE_BUSY_TIMEOUT}
+    else:
+        # PostgreSQL：只读连接池的会话默认只读事务。
+        # 上传通过改名替换 merchants 表，缓存的预编译语句会指向旧表而失效，异步连接不缓存预编译语句
+        connect_args = {}
+        read_args = {"options": "-c default_transaction_read_only=on"}
+        async_url = make_url(url).set(drivername="postgresql+asyncpg")
+        async_url = async_url.update_query_dict({"prepared_statement_cache_size": "0"})
+        async_args = {"server_settings": {"default_transaction_read_only": "on"}}
+
+    # 写连接：连接池只有一个连接，其他写操作最多等待 pool_timeout 秒，超时抛出 sqlalchemy.exc.TimeoutError
+    # （上传期间的回滚返回 503；机构汇总表的补算放到 ingest 线程池，与上传排队执行）
+    write = create_engine(
+        _sync_url(url), poolclass=QueuePool, pool_size=1, max_overflow=0,
+        pool_timeout=SQLITE_BUSY_TIMEOUT, connect_args=connect_args,
+    )
+    # 同步只读连接池：导出、历史对比、统计摘要等在线程池中执行的查询
+    read = create_engine(
+        _sync_url(url), poolclass=QueuePool, pool_size=READ_POOL_SIZE, max_overflow=0, connect_args=read_args,
+    )
+    # 异步只读连接池（aiosqlite / asyncpg），供 async 路由使用
+    async_read = create_async_engine(
+        async_url, poolclass=AsyncAdaptedQueuePool, pool_size=READ_POOL_SIZE, max_overflow=0,
+        connect_args=async_args,
+    )
+    if backend_name(url) == "sqlite":
+        event.listen(write, "connect", _on_connect(readonly=False))
+        event.listen(read, "connect", _on_connect(readonly=True))
+        event.listen(async_read.sync_engine, "connect", _on_connect(readonly=True))
+    return write, read, async_read
+
+
+write_engine, read_engine, async_read_engine = _create_engines(DATABASE_URL)
+instrument_engine(write_engine, "write")
+instrument_engine(read_engine, "read")
+instrument_engine(async_read_engine.sync_engine, "async_read")
+
+
+def open_connection(target: str = DATABASE_URL):
+    # 命令行工具使用的写连接：target 为 SQLite 文件路径或数据库 URL
+    if "://" not in target:
+        return connect(target)
+    if backend_name(target) == "sqlite":
+        return connect(make_url(target).database)
+    return create_engine(_sync_url(target), poolclass=NullPool).raw_connection()
+
+
+async def dispose_engines():
+    await async_read_engine.dispose()
+    read_engine.dispose()
+    write_engine.dispose()
@@ -0,0 +1,95 @@
+import logging
+import os
+import random
+import threading
+
+from sqlalchemy import text
+
+from cache import get_generation
+
+logger = logging.getLogger(__name__)
+
+# 诊断日志配置：MERCHANT_DEBUG=1 时每个查询都记录示例数据和统计信息，
+# 否则按 DIAGNOSTICS_SAMPLE_RATE（0~1）抽样记录，默认关闭
+DIAGNOSTICS_ENABLED = os.getenv("MERCHANT_DEBUG", "0") == "1"
+DIAGNOSTICS_SAMPLE_RATE = float(os.getenv("DIAGNOSTICS_SAMPLE_RATE", "0"))
+
+SUMMARY_SAMPLE_SIZE = 5
+
+
+def should_log_diagnostics() -> bool:
+    if DIAGNOSTICS_ENABLED:
+        return True
+    return DIAGNOSTICS_SAMPLE_RATE > 0 and random.random() < DIAGNOSTICS_SAMPLE_RATE
+
+
+class TableSummary:
+    # merchants 表的统计摘要，按数据代次缓存，只有上传提交后才重新计算
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._summary = None
+
+    def get(self, db) -> dict:
+        generation = get_generation(db)
+        with self._lock:
+            if self._summary is not None and self._generation == generation:
+                return self._summary
+        return self.refresh(db, generation)
+
+    def refresh(self, db, generation=None) -> dict:
+        if generation is None:
+            generation = get_generation(db)
+        total, min_count, max_count, avg_count = db.execute(text(
+            "SELECT COUNT(*), MIN(transaction_count), MAX(transaction_count), "
+            "AVG(transaction_count) FROM merchants"
+        )).fetchone()
+        sample = db.execute(text(
+            "SELECT merchant_id, merchant_name, institution, institution_id, transaction_count "
+            "FROM merchants LIMIT :limit"
+        ), {"limit": SUMMARY_SAMPLE_SIZE}).mappings().all()
+        summary = {
+            "generation": generation,
+            "total": total,
+            "min_transactions": min_count,
+            "max_transactions": max_count,
+            "avg_transactions": round(avg_count, 2) if avg_count is not None else None,
+            "sample": [dict(row) for row in sample],
+        }
+        with self._lock:
+            self._generation = generation
+            self._summary = summary
+        logger.info("已更新merchants表统计摘要: 数据代次 %s, 总记录数 %s", generation, total)
+        return summary
+
+
+table_summary = TableSummary()
+
+
+def explain_query_plan(db, statement) -> list:
+    # 返回 EXPLAIN QUERY PLAN（SQLite）或 EXPLAIN（PostgreSQL）的结果，用于确认查询是否走索引
+    sql = str(statement.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+    explain = "EXPLAIN QUERY PLAN" if db.bind.dialect.name == "sqlite" else "EXPLAIN"
+    return [row[-1] for row in db.execute(text(f"{explain} {sql}")).fetchall()]
+
+
+def log_query_diagnostics(db, items, statement=None):
+    # 仅在诊断模式下调用：页内统计直接基于本页结果，表级信息使用缓存摘要
+    if statement is not None:
+        logger.info("查询计划: %s", explain_query_plan(db, statement))
+    summary = table_summary.get(db)
+    logger.info("数据库中的示例数据: %s", summary['sample'])
+    if items:
+        first = items[0]
+        logger.info(
+            "查询结果示例: 机构: %s, 机构号: %s, 商户名: %s, 商户号: %s",
+            first['institution'], first['institution_id'], first['merchant_name'], first['merchant_id'],
+        )
+        transaction_counts = [item['transaction_count'] for item in items]
+        logger.info(
+            "交易笔数统计 - 最小: %s, 最大: %s, 平均: %.2f",
+            min(transaction_counts), max(transaction_counts), sum(transaction_counts) / len(transaction_counts),
+        )
+    else:
+        logger.info("当前数据库总记录数: %s", summary['total'])
@@ -0,0 +1,54 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+# 耗时的同步任务放到独立的有界线程池中执行，避免阻塞 uvicorn 的事件循环：
+# ingest 负责 Excel 解析与批量写入，auth 负责 bcrypt 密码校验/哈希。
+# 两个线程池互相独立，大文件上传不会占满登录所需的线程，反之亦然
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", "2"))
+
+# 同时等待 auth 线程池的登录请求上限：登录突发时超出的请求直接拒绝，而不是在队列中无限堆积
+AUTH_MAX_PENDING = int(os.getenv("AUTH_MAX_PENDING", "32"))
+
+ingest_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+auth_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+
+# 批量导入时并行解析 Excel 的进程数，默认使用全部 CPU
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", str(os.cpu_count() or 1)))
+
+
+def process_pool(max_workers: int = INGEST_PROCESSES) -> ProcessPoolExecutor:
+    # 使用 spawn 启动子进程：服务进程中有多个线程，fork 可能继承被占用的锁
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def run_in_pool(pool: ThreadPoolExecutor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, partial(func, *args, **kwargs))
+
+
+class PoolBusy(RuntimeError):
+    """线程池中等待执行的任务已达上限"""
+
+
+class LimitedPool:
+    # 限制提交到线程池、尚未完成的任务数；计数只在事件循环线程中修改，不需要加锁
+    def __init__(self, pool: ThreadPoolExecutor, max_pending: int):
+        self.pool = pool
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def run(self, func, *args, **kwargs):
+        if self.pending >= self.max_pending:
+            raise PoolBusy(f"Too many pending tasks: {self.pending}")
+        self.pending += 1
+        try:
+            return await run_in_pool(self.pool, func, *args, **kwargs)
+        finally:
+            self.pending -= 1
+
+
+auth_limiter = LimitedPool(auth_pool, AUTH_MAX_PENDING)
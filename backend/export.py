@@ -0,0 +1,72 @@
+import csv
+import io
+import os
+import tempfile
+from typing import Iterable, Iterator, Tuple
+from urllib.parse import quote
+
+from openpyxl import Workbook
+
+from ingest import REQUIRED_COLUMNS
+
+# 导出时每次从数据库读取的行数，以及 CSV 每次输出的行数
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+# 导出文件的表头与上传模板一致，导出的文件可以直接重新上传
+EXPORT_HEADER = REQUIRED_COLUMNS
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def content_disposition(filename: str) -> str:
+    # 中文文件名需要按 RFC 5987 编码
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+
+def iter_csv(rows: Iterable[Tuple]) -> Iterator[bytes]:
+    # 带 BOM，Excel 打开时中文不会乱码
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_HEADER)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def iter_xlsx(rows: Iterable[Tuple]) -> Iterator[bytes]:
+    # write_only 模式逐行写入临时文件，内存占用与行数无关；
+    # xlsx 是 zip 格式，需要整个文件写完后再分块发送
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("商户数据")
+    sheet.append(EXPORT_HEADER)
+    for row in rows:
+        sheet.append(list(row))
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+EXPORT_WRITERS = {
+    "csv": iter_csv,
+    "xlsx": iter_xlsx,
+}
@@ -0,0 +1,210 @@
+import logging
+import os
+import re
+import time
+from datetime import date, datetime
+from typing import Optional
+
+from ingest import MERCHANT_FIELDS, MERCHANT_INDEXES, MERCHANTS_TABLE
+from storage import storage_for
+
+logger = logging.getLogger(__name__)
+
+# 历史数据：每次带数据日期的上传完成后，把线上 merchants 表复制为按数据日期命名的分区表
+# merchants_h{YYYYMMDD}，登记在 data_partitions 中。同一日期重复上传时替换该分区。
+# HISTORY_RETENTION 为保留的分区数（按数据日期从新到旧），超出的分区整表删除；0 表示不限
+HISTORY_RETENTION = int(os.getenv("HISTORY_RETENTION", "12"))
+
+DATA_PARTITIONS_DDL = """
+CREATE TABLE IF NOT EXISTS data_partitions (
+    period TEXT PRIMARY KEY,
+    data_date TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    generation INTEGER,
+    archived_at TEXT
+)
+"""
+
+_DISPLAY_DATE = re.compile(r"^(\d{1,2})月(\d{1,2})日$")
+
+
+class HistoryError(ValueError):
+    """指定的历史数据日期不存在"""
+
+
+def period_key(formatted_date: str, today: Optional[date] = None) -> str:
+    # 把 4月27日 转换为 2026-04-27：文件名中没有年份，晚于今天的日期视为去年的数据
+    match = _DISPLAY_DATE.match(formatted_date)
+    if match is None:
+        raise HistoryError(f"Invalid data date: {formatted_date}")
+    today = today or date.today()
+    month, day = int(match.group(1)), int(match.group(2))
+    year = today.year if (month, day) <= (today.month, today.day) else today.year - 1
+    return date(year, month, day).isoformat()
+
+
+def partition_table_name(period: str) -> str:
+    return f"merchants_h{period.replace('-', '')}"
+
+
+def list_partitions(conn) -> list:
+    cursor = conn.cursor()
+    try:
+        if not storage_for(conn).table_exists(cursor, "data_partitions"):
+            return []
+        cursor.execute(
+            "SELECT period, data_date, table_name, rows, generation, archived_at "
+            "FROM data_partitions ORDER BY period DESC"
+        )
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def find_partition(conn, data_date: str) -> dict:
+    # data_date 可以是 4月27日 或 2026-04-27；显示日期对应多个年份时取最近的一个
+    for partition in list_partitions(conn):
+        if data_date in (partition["period"], partition["data_date"]):
+            return partition
+    raise HistoryError(f"No historical data for {data_date}")
+
+
+def archive_partition(conn, formatted_date: str, generation: Optional[int] = None) -> dict:
+    # 复制当前 merchants 表为历史分区并建索引（商户号唯一索引用于期间对比的连接），随后按保留数清理旧分区
+    start = time.perf_counter()
+    period = period_key(formatted_date)
+    table_name = partition_table_name(period)
+    fields = ", ".join(MERCHANT_FIELDS)
+    storage = storage_for(conn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(DATA_PARTITIONS_DDL)
+        storage.begin(cursor)
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        cursor.execute(storage.merchants_ddl(table_name))
+        cursor.execute(
+            f"INSERT INTO {table_name} (id, {fields}) "
+            f"SELECT {storage.row_id}, {fields} FROM {MERCHANTS_TABLE} ORDER BY {storage.row_id}"
+        )
+        rows = cursor.rowcount
+        for name, columns, unique in MERCHANT_INDEXES:
+            storage.create_index(cursor, f"ix_{table_name}_{name}", table_name, columns, unique)
+        cursor.execute(
+            storage.sql(
+                "INSERT INTO data_partitions (period, data_date, table_name, rows, generation, archived_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (period) DO UPDATE SET "
+                "data_date = excluded.data_date, table_name = excluded.table_name, rows = excluded.rows, "
+                "generation = excluded.generation, archived_at = excluded.archived_at"
+            ),
+            (period, formatted_date, table_name, rows, generation, datetime.now().isoformat(timespec="seconds")),
+        )
+        pruned = _prune_partitions(cursor, storage)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    logger.info("已保存历史分区 %s: %s 条, 耗时 %.2fs", table_name, rows, time.perf_counter() - start)
+    if pruned:
+        logger.info("已清理旧分区 %s", ", ".join(pruned))
+    return {"period": period, "data_date": formatted_date, "table_name": table_name, "rows": rows}
+
+
+def _prune_partitions(cursor, storage) -> list:
+    if HISTORY_RETENTION <= 0:
+        return []
+    cursor.execute("SELECT period, table_name FROM data_partitions ORDER BY period DESC")
+    expired = cursor.fetchall()[HISTORY_RETENTION:]
+    for period, table_name in expired:
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+        cursor.execute(storage.sql("DELETE FROM data_partitions WHERE period = ?"), (period,))
+    return [table_name for _, table_name in expired]
+
+
+def _filter_clause(institution_id=None, institution=None, merchant_id=None):
+    conditions, params = [], []
+    for column, value in (("institution_id", institution_id), ("institution", institution), ("merchant_id", merchant_id)):
+        if value:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def period_deltas(conn, previous: dict, current: dict, page: int = 1, page_size: int = 50,
+                  changed_only: bool = False, order: str = "desc", **filters) -> dict:
+    # 两个分区按商户号对比交易笔数，全部在 SQL 中完成：
+    # 当前期的商户 LEFT JOIN 上一期，再补上只在上一期出现的商户（SQLite 没有 FULL OUTER JOIN）
+    where, params = _filter_clause(**filters)
+    cur_t, prev_t = current["table_name"], previous["table_name"]
+    rows_sql = f"""
+        WITH cur AS (SELECT * FROM {cur_t}{where}),
+             prev AS (SELECT * FROM {prev_t}{where}),
+             joined AS (
+                SELECT c.merchant_id, c.merchant_name, c.institution, c.institution_id,
+                       p.transaction_count AS previous_count, c.transaction_count AS current_count
+                FROM cur c LEFT JOIN prev p ON p.merchant_id = c.merchant_id
+                UNION ALL
+                SELECT p.merchant_id, p.merchant_name, p.institution, p.institution_id,
+                       p.transaction_count, NULL
+                FROM prev p WHERE NOT EXISTS (SELECT 1 FROM cur c WHERE c.merchant_id = p.merchant_id)
+             ),
+             deltas AS (
+                SELECT *, COALESCE(current_count, 0) - COALESCE(previous_count, 0) AS delta FROM joined
+             )
+    """
+    rows_params = params + params
+    changed = " WHERE delta != 0" if changed_only else ""
+    direction = "ASC" if order == "asc" else "DESC"
+
+    storage = storage_for(conn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            storage.sql(rows_sql + f"""
+            SELECT COUNT(*), SUM(previous_count), SUM(current_count),
+                   SUM(CASE WHEN previous_count IS NULL THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN current_count IS NULL THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN delta > 0 THEN 1 ELSE 0 END), SUM(CASE WHEN delta < 0 THEN 1 ELSE 0 END)
+            FROM deltas{changed}
+            """),
+            rows_params,
+        )
+        # PostgreSQL 的 SUM 返回 Decimal，统一转换为 int
+        total, previous_total, current_total, added, removed, increased, decreased = (
+            int(value or 0) for value in cursor.fetchone()
+        )
+        cursor.execute(
+            storage.sql(rows_sql + f"""
+            SELECT merchant_id, merchant_name, institution, institution_id, previous_count, current_count, delta
+            FROM deltas{changed}
+            ORDER BY delta {direction}, merchant_id
+            LIMIT ? OFFSET ?
+            """),
+            rows_params + [page_size, max(page - 1, 0) * page_size],
+        )
+        names = [column[0] for column in cursor.description]
+        items = [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+    return {
+        "previous": previous["data_date"],
+        "current": current["data_date"],
+        "summary": {
+            "merchants": total,
+            "previous_transactions": previous_total,
+            "current_transactions": current_total,
+            "delta": current_total - previous_total,
+            "added": added,
+            "removed": removed,
+            "increased": increased,
+            "decreased": decreased,
+        },
+        "items": items,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+    }
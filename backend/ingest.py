@@ -0,0 +1,655 @@
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from metrics import observe_phase
+from search import SEARCH_COLUMNS, build_search_index, search_index_supported, search_table
+from storage import storage_for
+
+logger = logging.getLogger(__name__)
+
+# 批量写入配置：每次写入的行数（SQLite 为一次 executemany，PostgreSQL 为一次 COPY）
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "5000"))
+
+# 上传文件落盘时每次读取的字节数
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# 写入方式：swap 先写入影子表再原子替换；replace 在原表上清空后重写；
+# delta 按商户号与现有数据比对，只写入新增/变化/删除的行
+INGEST_MODE = os.getenv("INGEST_MODE", "swap")
+INGEST_MODES = ("swap", "replace", "delta")
+
+# 影子表与上一代数据表
+MERCHANTS_TABLE = "merchants"
+STAGING_TABLE = "merchants_next"
+PREVIOUS_TABLE = "merchants_prev"
+DELTA_TABLE = "merchants_delta"
+ROLLBACK_TABLE = "merchants_rollback"
+
+# 上传文件的列名兼容（旧模板使用 counts）
+COLUMN_MAPPING = {
+    'counts': '有效交易笔数'
+}
+
+# 必要的列
+REQUIRED_COLUMNS = ['商户号', '商户名称', '机构', '机构号', '有效交易笔数']
+
+# Excel列名 -> 数据库字段
+FIELD_MAPPING = {
+    '商户号': 'merchant_id',
+    '商户名称': 'merchant_name',
+    '机构': 'institution',
+    '机构号': 'institution_id',
+    '有效交易笔数': 'transaction_count',
+}
+MERCHANT_FIELDS = tuple(FIELD_MAPPING.values())
+
+# merchants 表的索引：(名称, 列, 是否唯一)，与 get_merchants 的查询条件对应：
+# 机构号/机构名称等值查询，可叠加交易笔数范围（复合索引同时覆盖 COUNT(*)）；
+# 仅按交易笔数筛选时使用 transaction_count 索引。
+# 表改名后索引名不变，所以索引名带上数据代次以免与旧表冲突
+MERCHANT_INDEXES = [
+    ("merchant_id", ("merchant_id",), True),
+    ("institution_id_tx", ("institution_id", "transaction_count"), False),
+    ("institution_tx", ("institution", "transaction_count"), False),
+    ("transaction_count", ("transaction_count",), False),
+]
+
+# 还没有上传过带日期的文件时显示的数据日期
+DEFAULT_DATA_DATE = os.getenv("DEFAULT_DATA_DATE", "4月27日")
+
+# data_date 表中 id=1 为线上数据的日期，id=2 为 merchants_prev 的日期（回滚时一起换回）
+CURRENT_DATE_ID = 1
+PREVIOUS_DATE_ID = 2
+
+DATA_DATE_DDL = """
+CREATE TABLE IF NOT EXISTS data_date (
+    id INTEGER PRIMARY KEY,
+    date TEXT
+)
+"""
+
+DATA_GENERATION_DDL = """
+CREATE TABLE IF NOT EXISTS data_generation (
+    id INTEGER PRIMARY KEY,
+    generation INTEGER NOT NULL,
+    loaded_at TEXT
+)
+"""
+
+
+class IngestError(ValueError):
+    """上传数据不符合要求（缺少列、交易笔数无法转换等）"""
+
+
+class IngestStats:
+    def __init__(self, rows: int, seconds: float, generation: int = 0):
+        self.rows = rows
+        self.seconds = seconds
+        self.generation = generation
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "generation": self.generation,
+        }
+
+
+class DeltaStats(IngestStats):
+    # 增量导入的变化统计：rows 为上传文件中的行数
+    def __init__(self, rows: int, seconds: float, generation: int, inserted: int, updated: int, deleted: int):
+        super().__init__(rows, seconds, generation)
+        self.inserted = inserted
+        self.updated = updated
+        self.deleted = deleted
+
+    @property
+    def changes(self) -> dict:
+        return {"inserted": self.inserted, "updated": self.updated, "deleted": self.deleted}
+
+    def as_dict(self):
+        result = super().as_dict()
+        result.update(self.changes)
+        return result
+
+
+def prepare_frame(df: pd.DataFrame, row_offset: int = 2) -> pd.DataFrame:
+    # df 的索引加上 row_offset 即为 Excel 中的行号（表头占第1行），用于错误提示
+    # 重命名列（如果需要）
+    df = df.rename(columns=COLUMN_MAPPING)
+
+    # 验证必要的列
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise IngestError(f"Missing required columns: {', '.join(missing_columns)}")
+
+    # 按列整体转换类型，避免逐行 str()/int()
+    frame = pd.DataFrame({
+        FIELD_MAPPING[col]: df[col].astype(str)
+        for col in REQUIRED_COLUMNS if col != '有效交易笔数'
+    })
+    counts = pd.to_numeric(df['有效交易笔数'], errors='coerce')
+    invalid = counts.isna()
+    if invalid.any():
+        position = int(invalid.to_numpy().argmax())
+        raise IngestError(
+            f"Error processing row {df.index[position] + row_offset}: invalid 有效交易笔数 "
+            f"{df['有效交易笔数'].iloc[position]!r}"
+        )
+    frame['transaction_count'] = counts.astype('int64')
+    return frame[list(MERCHANT_FIELDS)]
+
+
+def resolve_columns(header) -> List[int]:
+    # 根据表头找到必要列所在的位置
+    names = [COLUMN_MAPPING.get(name, name) for name in header]
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in names]
+    if missing_columns:
+        raise IngestError(f"Missing required columns: {', '.join(missing_columns)}")
+    return [names.index(col) for col in REQUIRED_COLUMNS]
+
+
+def parse_data_date(filename: str) -> Optional[str]:
+    # 从 未月活-MMDD.xlsx 格式的文件名中解析数据日期（如 4月27日），不符合格式时返回 None
+    formatted_date = None
+    logger.info("上传文件名: %s", filename)
+    
+    if filename.startswith("未月活-") and filename.endswith(".xlsx"):
+        try:
+            # 修复日期提取逻辑
+            date_str = filename[3:-5]  # 提取 MMDD 部分
+            logger.info("提取的日期字符串: %s", date_str)
+            
+            # 处理可能的负号
+            if date_str.startswith('-'):
+                date_str = date_str[1:]  # 去掉负号
+                logger.info("去掉负号后的日期字符串: %s", date_str)
+            
+            # 确保日期字符串长度正确
+            if len(date_str) == 4:
+                month = int(date_str[:2])
+                day = int(date_str[2:])
+                if 1 <= month <= 12 and 1 <= day <= 31:
+                    formatted_date = f"{month}月{day}日"
+                    logger.info("从文件名解析出日期: %s", formatted_date)
+                else:
+                    logger.warning("解析出的月份或日期无效: 月=%s, 日=%s", month, day)
+            else:
+                logger.warning("日期字符串长度不正确: %s, 长度: %s", date_str, len(date_str))
+        except (ValueError, IndexError) as e:
+            logger.error("解析文件名日期失败: %s", e)
+            pass  # 如果解析失败，继续使用原有功能
+    else:
+        logger.info("文件名不符合格式要求，不解析日期")
+    return formatted_date
+
+
+async def spool_upload(file, dest: Optional[str] = None) -> str:
+    # 分块把上传内容写入临时文件，避免整个文件读入内存
+    # 写入失败（如客户端断开、磁盘已满）时删除写了一半的文件
+    if dest is None:
+        fd, dest = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+    try:
+        with open(dest, "wb") as buffer:
+            while True:
+                chunk = await file.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(dest)
+        raise
+    return dest
+
+
+def list_sheets(path: str) -> List[str]:
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def iter_excel_batches(path: str, batch_size: int = INGEST_CHUNK_SIZE, sheet: Optional[str] = None,
+                       skip_empty: bool = False) -> Iterator[List[Tuple]]:
+    # 以只读模式逐行读取工作表（默认第一个），每凑满 batch_size 行做一次校验和类型转换，
+    # 内存占用只与 batch_size 有关，与文件大小无关；skip_empty 时完全空白的工作表不报错
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        if sheet is not None and sheet not in workbook.sheetnames:
+            raise IngestError(f"Worksheet not found: {sheet}")
+        worksheet = workbook[sheet] if sheet is not None else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            if skip_empty:
+                return
+            raise IngestError(f"Missing required columns: {', '.join(REQUIRED_COLUMNS)}")
+        positions = resolve_columns(header)
+        logger.info("列名: %s", list(header))
+
+        batch, row_numbers = [], []
+        for row_number, row in enumerate(rows, start=2):
+            values = [row[i] if i < len(row) else None for i in positions]
+            if all(value is None for value in values):
+                continue
+            batch.append(values)
+            row_numbers.append(row_number)
+            if len(batch) >= batch_size:
+                yield _convert_batch(batch, row_numbers)
+                batch, row_numbers = [], []
+        if batch:
+            yield _convert_batch(batch, row_numbers)
+    finally:
+        workbook.close()
+
+
+def _convert_batch(batch, row_numbers) -> List[Tuple]:
+    df = pd.DataFrame(batch, columns=REQUIRED_COLUMNS, index=row_numbers)
+    frame = prepare_frame(df, row_offset=0)
+    return next(iter_chunks(frame, len(frame)))
+
+
+def iter_chunks(frame: pd.DataFrame, chunk_size: int = INGEST_CHUNK_SIZE) -> Iterator[List[Tuple]]:
+    # tolist() 会把 numpy 类型转成 Python 原生类型，sqlite3 才能绑定
+    for start in range(0, len(frame), chunk_size):
+        chunk = frame.iloc[start:start + chunk_size]
+        yield list(zip(*(chunk[field].tolist() for field in MERCHANT_FIELDS)))
+
+
+def _table_exists(cursor, table: str) -> bool:
+    return storage_for(cursor.connection).table_exists(cursor, table)
+
+
+def current_generation(conn) -> int:
+    cursor = conn.cursor()
+    try:
+        if not storage_for(conn).table_exists(cursor, "data_generation"):
+            return 0
+        cursor.execute("SELECT generation FROM data_generation WHERE id = 1")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    finally:
+        cursor.close()
+
+
+def _rename_table(cursor, old: str, new: str):
+    # 要改名的表必须存在：影子表被并发的上传/回滚删掉时报错回滚，而不是提交一个没有 merchants 表的结果
+    if not _table_exists(cursor, old):
+        raise IngestError(f"Table {old} does not exist, another upload or rollback may be running")
+    cursor.execute(f"ALTER TABLE {old} RENAME TO {new}")
+
+
+def _rename_with_search_index(cursor, old: str, new: str):
+    # 数据表与其全文索引一起改名；全文索引表可能不存在（PostgreSQL、不支持 FTS5 的 SQLite、早于全文索引功能的旧表）
+    _rename_table(cursor, old, new)
+    if _table_exists(cursor, search_table(old)):
+        _rename_table(cursor, search_table(old), search_table(new))
+
+
+def _create_indexes(cursor, table: str, generation: int):
+    storage = storage_for(cursor.connection)
+    existing = storage.index_columns(cursor, table)
+    for name, columns, unique in MERCHANT_INDEXES:
+        if columns in existing:
+            continue
+        storage.create_index(cursor, f"ix_merchants_g{generation}_{name}", table, columns, unique)
+    storage.search_indexes(cursor, table, generation)
+
+
+def ensure_indexes(conn):
+    # 为已有的 merchants 表补建缺少的索引（按列判断，已存在的同列索引不重复建立）
+    generation = current_generation(conn)
+    cursor = conn.cursor()
+    try:
+        if _table_exists(cursor, MERCHANTS_TABLE):
+            _create_indexes(cursor, MERCHANTS_TABLE, generation)
+            conn.commit()
+    finally:
+        cursor.close()
+
+
+def _create_state_tables(cursor):
+    cursor.execute(DATA_GENERATION_DDL)
+    cursor.execute(DATA_DATE_DDL)
+
+
+def _data_date_changed(cursor, data_date: Optional[str]) -> bool:
+    if not data_date:
+        return False
+    cursor.execute("SELECT date FROM data_date WHERE id = 1")
+    row = cursor.fetchone()
+    return row is None or row[0] != data_date
+
+
+def _publish_generation(cursor, generation: int, data_date: Optional[str] = None):
+    # 在替换数据的同一事务中更新数据代次和数据日期：其他进程看到新代次时一定也看到新日期，
+    # 按代次缓存的数据日期（cache.DataDateCache）不会读到旧值
+    storage = storage_for(cursor.connection)
+    cursor.execute(
+        storage.sql(
+            "INSERT INTO data_generation (id, generation, loaded_at) VALUES (1, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET generation = excluded.generation, loaded_at = excluded.loaded_at"
+        ),
+        (generation, datetime.now().isoformat(timespec="seconds")),
+    )
+    if data_date:
+        cursor.execute(
+            storage.sql(
+                "INSERT INTO data_date (id, date) VALUES (1, ?) ON CONFLICT (id) DO UPDATE SET date = excluded.date"
+            ),
+            (data_date,),
+        )
+        logger.info("数据日期更新为: %s", data_date)
+
+
+def _save_previous_date(cursor):
+    # 线上表改名为 merchants_prev 时，在同一事务中把它的数据日期记为 id=2（没有日期时记为 NULL）
+    storage = storage_for(cursor.connection)
+    cursor.execute(storage.sql("DELETE FROM data_date WHERE id = ?"), (PREVIOUS_DATE_ID,))
+    cursor.execute(
+        storage.sql("INSERT INTO data_date (id, date) VALUES (?, (SELECT date FROM data_date WHERE id = ?))"),
+        (PREVIOUS_DATE_ID, CURRENT_DATE_ID),
+    )
+
+
+def _swap_dates(cursor):
+    # 回滚时交换 id=1 与 id=2 的数据日期；
+    # 早于本功能保存的 merchants_prev 没有日期记录，保持当前日期不变
+    storage = storage_for(cursor.connection)
+    cursor.execute(storage.sql("SELECT id, date FROM data_date WHERE id IN (?, ?)"), (CURRENT_DATE_ID, PREVIOUS_DATE_ID))
+    dates = dict(cursor.fetchall())
+    if PREVIOUS_DATE_ID not in dates:
+        logger.warning("上一代数据没有记录数据日期，回滚后数据日期不变")
+        return
+    for date_id, value in ((CURRENT_DATE_ID, dates[PREVIOUS_DATE_ID]), (PREVIOUS_DATE_ID, dates.get(CURRENT_DATE_ID))):
+        cursor.execute(
+            storage.sql("INSERT INTO data_date (id, date) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET date = excluded.date"),
+            (date_id, value),
+        )
+    logger.info("数据日期恢复为: %s", dates[PREVIOUS_DATE_ID])
+
+
+def _report(progress, phase: str, rows: int):
+    # progress(phase, rows) 用于上传任务汇报进度；回调抛出异常（如任务被取消）会中止本次写入并回滚
+    if progress is not None:
+        progress(phase, rows)
+
+
+def _write_chunks(cursor, chunks, table: str, progress=None) -> int:
+    # chunks 逐批读取并校验 Excel，读取（parse）与写入（insert）交替进行，分别累计耗时
+    rows = 0
+    storage = storage_for(cursor.connection)
+    parse_seconds = insert_seconds = 0.0
+    chunks = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        parse_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        start = time.perf_counter()
+        rows += storage.write_rows(cursor, table, MERCHANT_FIELDS, chunk)
+        insert_seconds += time.perf_counter() - start
+        logger.debug("已写入 %d 条记录", rows)
+        _report(progress, "loading", rows)
+    observe_phase("parse", parse_seconds)
+    observe_phase("insert", insert_seconds)
+    return rows
+
+
+def _log_stats(stats: "IngestStats"):
+    logger.info(
+        "批量写入完成: %s 条, 耗时 %.2fs, %.0f 行/秒, 数据代次 %s",
+        stats.rows, stats.seconds, stats.rows_per_second, stats.generation,
+    )
+
+
+def bulk_insert(conn, chunks, progress=None, data_date: Optional[str] = None) -> IngestStats:
+    # conn 为 DB-API 连接（sqlite3、psycopg2 或 engine.raw_connection()），
+    # 清空与写入在同一个事务中完成，失败时整体回滚
+    start = time.perf_counter()
+    generation = current_generation(conn) + 1
+    storage = storage_for(conn)
+    cursor = conn.cursor()
+    try:
+        _create_state_tables(cursor)
+        storage.begin(cursor)
+        cursor.execute(f"DELETE FROM {MERCHANTS_TABLE}")
+        rows = _write_chunks(cursor, chunks, MERCHANTS_TABLE, progress)
+        _report(progress, "indexing", rows)
+        index_start = time.perf_counter()
+        if search_index_supported(conn):
+            build_search_index(cursor, MERCHANTS_TABLE)
+        observe_phase("index", time.perf_counter() - index_start)
+        _publish_generation(cursor, generation, data_date)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    stats = IngestStats(rows, time.perf_counter() - start, generation)
+    _log_stats(stats)
+    return stats
+
+
+def _drop_staging(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    cursor.execute(f"DROP TABLE IF EXISTS {search_table(STAGING_TABLE)}")
+
+
+def swap_load(conn, chunks, progress=None, data_date: Optional[str] = None) -> IngestStats:
+    # 1. 写入影子表并建索引，此时线上 merchants 表不受影响
+    # 2. 在一个很短的事务中通过改名替换，旧表保留为 merchants_prev 以便回滚
+    start = time.perf_counter()
+    generation = current_generation(conn) + 1
+    storage = storage_for(conn)
+    cursor = conn.cursor()
+    try:
+        _create_state_tables(cursor)
+        _drop_staging(cursor)
+        cursor.execute(storage.merchants_ddl(STAGING_TABLE))
+        storage.begin(cursor)
+        rows = _write_chunks(cursor, chunks, STAGING_TABLE, progress)
+        # 数据写完后再建索引，比边写边维护索引快
+        _report(progress, "indexing", rows)
+        index_start = time.perf_counter()
+        _create_indexes(cursor, STAGING_TABLE, generation)
+        if search_index_supported(conn):
+            build_search_index(cursor, STAGING_TABLE)
+        conn.commit()
+        observe_phase("index", time.perf_counter() - index_start)
+        logger.info("影子表 %s 写入完成，开始替换", STAGING_TABLE)
+        _report(progress, "swapping", rows)
+
+        swap_start = time.perf_counter()
+        storage.begin_exclusive(cursor)
+        cursor.execute(f"DROP TABLE IF EXISTS {PREVIOUS_TABLE}")
+        cursor.execute(f"DROP TABLE IF EXISTS {search_table(PREVIOUS_TABLE)}")
+        # 首次导入时还没有 merchants 表
+        if _table_exists(cursor, MERCHANTS_TABLE):
+            _rename_with_search_index(cursor, MERCHANTS_TABLE, PREVIOUS_TABLE)
+        _rename_with_search_index(cursor, STAGING_TABLE, MERCHANTS_TABLE)
+        _save_previous_date(cursor)
+        _publish_generation(cursor, generation, data_date)
+        conn.commit()
+        observe_phase("swap", time.perf_counter() - swap_start)
+    except Exception:
+        conn.rollback()
+        _drop_staging(cursor)
+        conn.commit()
+        raise
+    finally:
+        cursor.close()
+
+    stats = IngestStats(rows, time.perf_counter() - start, generation)
+    _log_stats(stats)
+    return stats
+
+
+def _apply_delta(cursor, search_index: bool):
+    # 在一个事务中把临时表 merchants_delta 合并到 merchants，返回 (新增, 更新, 删除) 行数。
+    # 全文索引只维护被删除、新增和商户名称变化的行（rowid 与 merchants 一致）
+    storage = storage_for(cursor.connection)
+    delta = storage.temp_table(DELTA_TABLE)
+    # 上传文件中重复的商户号只保留最后一条（id 最大），之后每个商户号在临时表中只有一行
+    cursor.execute(f"DELETE FROM {delta} WHERE id NOT IN (SELECT MAX(id) FROM {delta} GROUP BY merchant_id)")
+    missing = f"NOT EXISTS (SELECT 1 FROM {delta} d WHERE d.merchant_id = {MERCHANTS_TABLE}.merchant_id)"
+    if search_index:
+        cursor.execute(
+            f"DELETE FROM {search_table(MERCHANTS_TABLE)} WHERE rowid IN "
+            f"(SELECT rowid FROM {MERCHANTS_TABLE} WHERE {missing})"
+        )
+        cursor.execute(
+            f"DELETE FROM {search_table(MERCHANTS_TABLE)} WHERE rowid IN "
+            f"(SELECT m.rowid FROM {MERCHANTS_TABLE} m JOIN {delta} d ON d.merchant_id = m.merchant_id "
+            f"WHERE m.merchant_name IS NOT d.merchant_name)"
+        )
+    cursor.execute(f"DELETE FROM {MERCHANTS_TABLE} WHERE {missing}")
+    deleted = cursor.rowcount
+
+    cursor.execute(
+        f"SELECT COUNT(*) FROM {delta} d WHERE NOT EXISTS "
+        f"(SELECT 1 FROM {MERCHANTS_TABLE} m WHERE m.merchant_id = d.merchant_id)"
+    )
+    inserted = cursor.fetchone()[0]
+
+    # 只有字段确实变化时才更新，未变化的行不产生写入
+    cursor.execute(
+        f"INSERT INTO {MERCHANTS_TABLE} ({', '.join(MERCHANT_FIELDS)}) {storage.upsert_source(delta, MERCHANT_FIELDS)} "
+        f"ON CONFLICT (merchant_id) DO UPDATE SET "
+        + ", ".join(f"{field} = excluded.{field}" for field in MERCHANT_FIELDS if field != "merchant_id")
+        + " WHERE "
+        + " OR ".join(
+            storage.distinct(f"{MERCHANTS_TABLE}.{field}", f"excluded.{field}")
+            for field in MERCHANT_FIELDS if field != "merchant_id"
+        )
+    )
+    updated = cursor.rowcount - inserted
+
+    if search_index:
+        cursor.execute(
+            f"INSERT INTO {search_table(MERCHANTS_TABLE)} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+            f"SELECT DISTINCT m.rowid, {', '.join('m.' + name for name in SEARCH_COLUMNS)} FROM {MERCHANTS_TABLE} m "
+            f"JOIN {delta} d ON d.merchant_id = m.merchant_id "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {search_table(MERCHANTS_TABLE)} f WHERE f.rowid = m.rowid)"
+        )
+    return inserted, updated, deleted
+
+
+def delta_load(conn, chunks, progress=None, data_date: Optional[str] = None) -> IngestStats:
+    # 上传数据先写入临时表，再在一个短事务中与 merchants 比对合并：
+    # 不在上传文件中的商户删除，新商户插入，字段变化的商户更新（INSERT ... ON CONFLICT）。
+    # 没有任何变化时数据代次不变，查询缓存和快照继续有效
+    start = time.perf_counter()
+    storage = storage_for(conn)
+    delta = storage.temp_table(DELTA_TABLE)
+    cursor = conn.cursor()
+    if not storage.table_exists(cursor, MERCHANTS_TABLE):
+        # 首次导入没有可比对的数据，按全量替换处理
+        cursor.close()
+        return swap_load(conn, chunks, progress, data_date)
+    try:
+        _create_state_tables(cursor)
+        cursor.execute(f"DROP TABLE IF EXISTS {delta}")
+        storage.create_temp_merchants(cursor, DELTA_TABLE)
+        storage.begin(cursor)
+        rows = _write_chunks(cursor, chunks, delta, progress)
+        storage.create_index(cursor, f"ix_{DELTA_TABLE}_merchant_id", DELTA_TABLE, ("merchant_id",), temp=True)
+        conn.commit()
+
+        _report(progress, "applying", rows)
+        apply_start = time.perf_counter()
+        storage.begin_exclusive(cursor)
+        generation = current_generation(conn)
+        search_index = storage.table_exists(cursor, search_table(MERCHANTS_TABLE))
+        inserted, updated, deleted = _apply_delta(cursor, search_index)
+        if inserted or updated or deleted or _data_date_changed(cursor, data_date):
+            # 只有数据日期变化时同样更新代次，缓存的查询结果中带有数据日期
+            generation += 1
+            _publish_generation(cursor, generation, data_date)
+        if inserted or updated or deleted:
+            # 原表被就地修改，merchants_prev 已不是本次上传前的数据，不能再用于回滚
+            cursor.execute(f"DROP TABLE IF EXISTS {PREVIOUS_TABLE}")
+            cursor.execute(f"DROP TABLE IF EXISTS {search_table(PREVIOUS_TABLE)}")
+        conn.commit()
+        observe_phase("apply", time.perf_counter() - apply_start)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        # 临时表属于连接，连接放回连接池前删除
+        try:
+            cursor.execute(f"DROP TABLE IF EXISTS {delta}")
+            conn.commit()
+        finally:
+            cursor.close()
+
+    stats = DeltaStats(rows, time.perf_counter() - start, generation, inserted, updated, deleted)
+    _log_stats(stats)
+    logger.info("增量导入: 新增 %s 条, 更新 %s 条, 删除 %s 条", inserted, updated, deleted)
+    return stats
+
+
+def rollback_generation(conn) -> int:
+    # 把 merchants_prev 换回线上表，当前数据变为 merchants_prev（可再次回滚）；
+    # 数据日期在同一事务中一起换回，/api/data-date 与数据保持一致
+    # 先取得写锁再检查和改名；交换使用单独的中间表名，不影响并发上传正在写入的影子表
+    cursor = conn.cursor()
+    try:
+        _create_state_tables(cursor)
+        storage_for(conn).begin_exclusive(cursor)
+        if not _table_exists(cursor, PREVIOUS_TABLE):
+            raise IngestError("No previous data to roll back to")
+        generation = current_generation(conn) + 1
+        _rename_with_search_index(cursor, MERCHANTS_TABLE, ROLLBACK_TABLE)
+        _rename_with_search_index(cursor, PREVIOUS_TABLE, MERCHANTS_TABLE)
+        _rename_with_search_index(cursor, ROLLBACK_TABLE, PREVIOUS_TABLE)
+        # 上一代数据可能早于全文索引功能，没有对应的索引表时补建
+        if search_index_supported(conn) and not _table_exists(cursor, search_table(MERCHANTS_TABLE)):
+            build_search_index(cursor, MERCHANTS_TABLE)
+        _swap_dates(cursor)
+        _publish_generation(cursor, generation)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    logger.info("已回滚到上一代数据，数据代次 %s", generation)
+    return generation
+
+
+def load_chunks(conn, chunks, mode: str = INGEST_MODE, progress=None, data_date: Optional[str] = None) -> IngestStats:
+    # data_date 不为空时与新数据在同一事务中生效
+    if mode == "swap":
+        return swap_load(conn, chunks, progress, data_date)
+    if mode == "delta":
+        return delta_load(conn, chunks, progress, data_date)
+    return bulk_insert(conn, chunks, progress, data_date)
+
+
+def load_dataframe(conn, df: pd.DataFrame, chunk_size: int = INGEST_CHUNK_SIZE,
+                   mode: str = INGEST_MODE, progress=None, data_date: Optional[str] = None) -> IngestStats:
+    frame = prepare_frame(df)
+    return load_chunks(conn, iter_chunks(frame, chunk_size), mode, progress, data_date)
+
+
+def load_excel(conn, path: str, chunk_size: int = INGEST_CHUNK_SIZE,
+               mode: str = INGEST_MODE, progress=None, data_date: Optional[str] = None) -> IngestStats:
+    return load_chunks(conn, iter_excel_batches(path, chunk_size), mode, progress, data_date)
@@ -1,39 +1,21 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from main import Base, UserDB, get_password_hash
+from auth import ADMIN_PASSWORD, ADMIN_USERNAME, ensure_admin_user
+from models import init_schema
 
-# 数据库配置
-SQLALCHEMY_DATABASE_URL = "sqlite:///./merchants.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
+# 创建数据库表（旧版 backend/app 的用户表一并迁移）
+init_schema()
 
 # 创建管理员用户
 def create_admin_user():
-    db = SessionLocal()
+    password = ADMIN_PASSWORD or "admin123"
     try:
-        # 检查是否已存在管理员用户
-        admin = db.query(UserDB).filter(UserDB.username == "admin").first()
-        if not admin:
-            admin_user = UserDB(
-                username="admin",
-                email="admin@example.com",
-                hashed_password=get_password_hash("admin123"),
-                is_admin=True
-            )
-            db.add(admin_user)
-            db.commit()
+        if ensure_admin_user(password):
             print("管理员用户创建成功！")
-            print("用户名: admin")
-            print("密码: admin123")
+            print(f"用户名: {ADMIN_USERNAME}")
+            print(f"密码: {password}")
         else:
             print("管理员用户已存在")
     except Exception as e:
         print(f"创建管理员用户失败: {str(e)}")
-    finally:
-        db.close()
 
 if __name__ == "__main__":
-    create_admin_user() 
\ No newline at end of file
+    create_admin_user()
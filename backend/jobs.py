@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from ingest import IngestError
+
+logger = logging.getLogger(__name__)
+
+# 上传任务状态存放在独立的 SQLite 文件中：导入期间 merchants.db 的写锁被影子表写入占用，
+# 进度更新不能和它抢锁；多个 worker 共享同一个文件，任意 worker 都能查询进度或取消任务
+UPLOAD_JOBS_PATH = os.getenv("UPLOAD_JOBS_PATH", "upload_jobs.db")
+
+# 任务状态与阶段
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+# 这些阶段数据尚未替换，可以取消；进入 finalizing 后新数据已经生效，取消请求不再处理
+CANCELLABLE_PHASES = ("queued", "parsing", "loading", "indexing", "swapping", "applying")
+
+
+class JobCancelled(Exception):
+    """上传任务在导入过程中被取消"""
+
+
+class UploadJobStore:
+    DDL = """
+    CREATE TABLE IF NOT EXISTS upload_jobs (
+        id TEXT PRIMARY KEY,
+        filename TEXT,
+        data_date TEXT,
+        created_by TEXT,
+        status TEXT NOT NULL,
+        phase TEXT NOT NULL,
+        rows INTEGER NOT NULL DEFAULT 0,
+        rows_per_second REAL,
+        elapsed_seconds REAL,
+        generation INTEGER,
+        error TEXT,
+        sources TEXT,
+        changes TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        worker_pid INTEGER,
+        created_at TEXT,
+        started_at TEXT,
+        finished_at TEXT
+    )
+    """
+
+    # sources: 批量导入时每个工作表的解析情况；changes: 增量导入的新增/更新/删除行数
+    JSON_COLUMNS = ("sources", "changes")
+
+    def __init__(self, path: str = UPLOAD_JOBS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(self.DDL)
+        # 旧版本创建的任务表缺少后来增加的 JSON 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(upload_jobs)")}
+        for name in self.JSON_COLUMNS:
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE upload_jobs ADD COLUMN {name} TEXT")
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def create(self, filename: str, data_date: Optional[str], created_by: Optional[str]) -> dict:
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO upload_jobs (id, filename, data_date, created_by, status, phase, worker_pid, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, filename, data_date, created_by, QUEUED, "queued", os.getpid(), _now()),
+        )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._execute("SELECT * FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        for name in self.JSON_COLUMNS:
+            job[name] = json.loads(job[name]) if job[name] else None
+        return job
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE upload_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def request_cancel(self, job_id: str) -> Optional[dict]:
+        # 排队中的任务直接标记为已取消；执行中的任务在下一批写入后检查标记并回滚
+        self._execute(
+            "UPDATE upload_jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)",
+            (job_id, QUEUED, RUNNING),
+        )
+        self._execute(
+            "UPDATE upload_jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, _now(), job_id, QUEUED),
+        )
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        row = self._execute("SELECT cancel_requested FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def recover_interrupted(self):
+        # 进程退出时未完成的任务不会再继续，启动时把所属进程已不存在的任务标记为失败
+        rows = self._execute(
+            "SELECT id, worker_pid FROM upload_jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+        ).fetchall()
+        for job_id, pid in rows:
+            if pid == os.getpid() or not _pid_alive(pid):
+                self.update(job_id, status=FAILED, error="Interrupted by server restart", finished_at=_now())
+                logger.warning("上传任务 %s 在服务重启时中断，已标记为失败", job_id)
+
+    def run(self, job_id: str, func, *args):
+        # 在 ingest 线程池中执行：func(*args, progress=...) 返回 IngestStats（批量导入为 BatchStats）
+        with self._lock:
+            claimed = self._conn.execute(
+                "UPDATE upload_jobs SET status = ?, phase = ?, started_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, "loading", _now(), job_id, QUEUED),
+            ).rowcount
+        if not claimed:
+            logger.info("上传任务 %s 已取消，跳过", job_id)
+            return
+
+        start = time.perf_counter()
+
+        def progress(phase: str, rows: int):
+            if phase in CANCELLABLE_PHASES and self.cancel_requested(job_id):
+                raise JobCancelled(f"Upload job {job_id} cancelled")
+            elapsed = time.perf_counter() - start
+            self.update(
+                job_id, phase=phase, rows=rows, elapsed_seconds=round(elapsed, 3),
+                rows_per_second=round(rows / elapsed, 1) if elapsed > 0 else None,
+            )
+
+        try:
+            stats = func(*args, progress=progress)
+        except JobCancelled:
+            logger.info("上传任务 %s 已取消，数据未替换", job_id)
+            self.update(job_id, status=CANCELLED, phase="cancelled", finished_at=_now())
+        except IngestError as e:
+            self.update(job_id, status=FAILED, phase="failed", error=str(e), finished_at=_now())
+        except Exception as e:
+            logger.error("上传任务 %s 失败: %s", job_id, e)
+            self.update(job_id, status=FAILED, phase="failed", error=str(e), finished_at=_now())
+        else:
+            self.update(
+                job_id, status=SUCCEEDED, phase="done", rows=stats.rows,
+                rows_per_second=round(stats.rows_per_second, 1),
+                elapsed_seconds=round(time.perf_counter() - start, 3),
+                generation=stats.generation, finished_at=_now(),
+                **{
+                    name: json.dumps(getattr(stats, name), ensure_ascii=False)
+                    for name in self.JSON_COLUMNS if hasattr(stats, name)
+                },
+            )
+            logger.info("上传任务 %s 完成: %s 条", job_id, stats.rows)
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+upload_jobs = UploadJobStore()
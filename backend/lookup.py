@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import os
+from typing import Iterable, Iterator, List
+
+from openpyxl import load_workbook
+
+# 批量查询商户号：每次请求最多的商户号个数，以及每条 IN (...) 查询包含的商户号个数
+# （SQLite 默认最多 999 个绑定参数）
+BATCH_LOOKUP_MAX_IDS = int(os.getenv("BATCH_LOOKUP_MAX_IDS", "10000"))
+BATCH_LOOKUP_CHUNK_SIZE = int(os.getenv("BATCH_LOOKUP_CHUNK_SIZE", "500"))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# 上传的商户号文件中，第一行是这个表头时跳过（与上传模板、导出文件一致）
+MERCHANT_ID_HEADER = "商户号"
+
+
+class BatchLookupError(ValueError):
+    """批量查询的商户号列表无效或超出上限"""
+
+
+def normalize_ids(values: Iterable, limit: int = BATCH_LOOKUP_MAX_IDS) -> List[str]:
+    # 去掉空值和重复的商户号，保持首次出现的顺序；Excel 中的数字商户号转换为字符串
+    merchant_ids = []
+    seen = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        merchant_id = str(value).strip()
+        if not merchant_id or merchant_id in seen:
+            continue
+        seen.add(merchant_id)
+        merchant_ids.append(merchant_id)
+        if len(merchant_ids) > limit:
+            raise BatchLookupError(f"Too many merchant IDs: at most {limit} per request")
+    if not merchant_ids:
+        raise BatchLookupError("No merchant IDs provided")
+    return merchant_ids
+
+
+def ids_from_json(payload) -> list:
+    # 接受 ["id", ...] 或 {"merchant_ids": ["id", ...]}
+    if isinstance(payload, dict):
+        payload = payload.get("merchant_ids")
+    if not isinstance(payload, list):
+        raise BatchLookupError("Expected a JSON list of merchant IDs or {\"merchant_ids\": [...]}")
+    return payload
+
+
+def ids_from_file(path: str, filename: str) -> Iterator:
+    # .xlsx 读取第一个工作表的第一列，.csv/.txt 每行取第一列；第一行为“商户号”表头时跳过
+    if filename.endswith(".xlsx"):
+        workbook = load_workbook(path, read_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(max_col=1, values_only=True)
+            for i, (value,) in enumerate(rows):
+                if i == 0 and value == MERCHANT_ID_HEADER:
+                    continue
+                yield value
+        finally:
+            workbook.close()
+    elif filename.endswith((".csv", ".txt")):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for i, row in enumerate(csv.reader(f)):
+                if not row or (i == 0 and row[0].strip() == MERCHANT_ID_HEADER):
+                    continue
+                yield row[0]
+    else:
+        raise BatchLookupError("Only .xlsx, .csv or .txt files are allowed")
+
+
+def iter_chunks(merchant_ids: List[str], chunk_size: int = BATCH_LOOKUP_CHUNK_SIZE) -> Iterator[List[str]]:
+    for start in range(0, len(merchant_ids), chunk_size):
+        yield merchant_ids[start:start + chunk_size]
+
+
+def iter_ndjson(merchant_ids: List[str], find, chunk_size: int = BATCH_LOOKUP_CHUNK_SIZE) -> Iterator[bytes]:
+    # find(chunk) 返回 {商户号: 商户数据}；逐块查询，每块按请求顺序一行输出一个结果，
+    # 最后一行为汇总 {"summary": {...}}
+    found = 0
+    buffer = io.StringIO()
+    for chunk in iter_chunks(merchant_ids, chunk_size):
+        merchants = find(chunk)
+        for merchant_id in chunk:
+            merchant = merchants.get(merchant_id)
+            if merchant is None:
+                line = {"merchant_id": merchant_id, "found": False}
+            else:
+                found += 1
+                line = {"merchant_id": merchant_id, "found": True, "merchant": merchant}
+            buffer.write(json.dumps(line, ensure_ascii=False) + "\n")
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    summary = {"requested": len(merchant_ids), "found": found, "missing": len(merchant_ids) - found}
+    yield (json.dumps({"summary": summary}, ensure_ascii=False) + "\n").encode("utf-8")
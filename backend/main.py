@@ -1,21 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Security
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import pandas as pd
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel
 import os
 import logging
-import sqlite3
-from sqlalchemy import text
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from io import BytesIO
+import threading
+import time
+from ingest import INGEST_MODE, INGEST_MODES, MERCHANT_FIELDS, IngestError, parse_data_date, spool_upload, rollback_generation, current_generation
+from cache import data_date_cache, get_generation, make_key, result_cache
+from snapshot import QUERY_ENGINE
+from diagnostics import table_summary
+from pagination import CursorError, decode_cursor
+from export import EXPORT_BATCH_SIZE, EXPORT_MEDIA_TYPES, EXPORT_WRITERS, content_disposition
+from executors import auth_pool, ingest_pool
+from jobs import FINISHED_STATUSES, upload_jobs
+from history import HistoryError, find_partition, list_partitions, period_deltas
+from lookup import NDJSON_MEDIA_TYPE, BatchLookupError, ids_from_file, ids_from_json, iter_ndjson, normalize_ids
+from aggregates import ensure_institution_summary, institution_summary, refresh_institution_summary, summary_generation
+from database import dispose_engines, read_engine
+from responses import json_response
+from principals import Principal
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, observe_request, observe_rows, registry as metrics_registry
+# 表结构、认证、查询条件和上传流程与 backend/app/main.py 共用
+from models import Merchant, SessionLocal, check_db_connection, engine, get_async_db, get_db, init_schema
+from auth import Token, get_current_active_user, login
+from queries import generation_and_date, merchant_conditions, merchant_to_dict, partition_columns, partition_for, query_merchants_page, snapshot_page
+from uploads import ingest_batch, ingest_upload
 
 # 配置日志
 logging.basicConfig(
@@ -24,14 +40,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# JWT配置
-SECRET_KEY = "your-secret-key"  # 在生产环境中应该使用环境变量
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-# 密码加密
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# 数据日期接口的 Cache-Control：默认每次向服务端重新验证（ETag 未变化时返回 304，不传输内容）
+DATA_DATE_CACHE_CONTROL = os.getenv("DATA_DATE_CACHE_CONTROL", "no-cache")
 
 app = FastAPI()
 
@@ -44,55 +54,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 数据库配置
-SQLALCHEMY_DATABASE_URL = "sqlite:///./merchants.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-# SQLAlchemy 模型
-class UserDB(Base):
-    __tablename__ = "users"
-
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
-    email = Column(String, unique=True, index=True)
-    hashed_password = Column(String)
-    is_admin = Column(Boolean, default=False)
-
-class Merchant(Base):
-    __tablename__ = "merchants"
-
-    id = Column(Integer, primary_key=True, index=True)
-    merchant_id = Column(String, unique=True, index=True)
-    merchant_name = Column(String)
-    institution = Column(String)
-    institution_id = Column(String)
-    transaction_count = Column(Integer)
-
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
-
-# 检查数据库连接
-def check_db_connection():
+# 请求耗时统计：按路由模板记录，/metrics 输出（见 metrics.py）
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
     try:
-        conn = sqlite3.connect('merchants.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='merchants'")
-        table_exists = cursor.fetchone() is not None
-        if table_exists:
-            cursor.execute("SELECT COUNT(*) FROM merchants")
-            count = cursor.fetchone()[0]
-            logger.info(f"数据库连接成功，merchants表存在，当前记录数: {count}")
-        else:
-            logger.warning("数据库连接成功，但merchants表不存在")
-        conn.close()
-    except Exception as e:
-        logger.error(f"数据库连接检查失败: {str(e)}")
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        observe_request(request.method, route, status_code, elapsed)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "request %s %s %d %.1fms", request.method, route, status_code, elapsed * 1000,
+                extra={"route": route, "status": status_code, "duration_ms": round(elapsed * 1000, 1)},
+            )
+
+# 建表并补建查询所需的索引、全文索引和机构汇总表（表结构见 models.py，与 backend/app 共用）
+init_schema()
 
 # 在应用启动时检查数据库
 check_db_connection()
 
+# 上次进程退出时未完成的上传任务标记为失败
+upload_jobs.recover_interrupted()
+
 # Pydantic 模型
 class UserBase(BaseModel):
     username: str
@@ -107,13 +96,6 @@ class UserInDB(UserBase):
     class Config:
         from_attributes = True
 
-class Token(BaseModel):
-    access_token: str
-    token_type: str
-
-class TokenData(BaseModel):
-    username: Optional[str] = None
-
 class MerchantBase(BaseModel):
     merchant_id: str
     merchant_name: str
@@ -127,90 +109,24 @@ class MerchantResponse(MerchantBase):
 
 class PaginatedResponse(BaseModel):
     items: List[MerchantResponse]
-    total: int
+    total: Optional[int]
     page: int
     page_size: int
-    total_pages: int
+    total_pages: Optional[int]
     data_date: str
-
-# 数据库依赖
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# 密码验证
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-# 用户认证
-def authenticate_user(db: SessionLocal, username: str, password: str):
-    user = db.query(UserDB).filter(UserDB.username == username).first()
-    if not user:
-        return False
-    if not verify_password(password, user.hashed_password):
-        return False
-    return user
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-async def get_current_user(token: str = Depends(oauth2_scheme), db: SessionLocal = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = db.query(UserDB).filter(UserDB.username == token_data.username).first()
-    if user is None:
-        raise credentials_exception
-    return user
-
-async def get_current_active_user(current_user: UserDB = Depends(get_current_user)):
-    return current_user
+    next_cursor: Optional[str] = None
 
 # 路由
 @app.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: SessionLocal = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
-    if not user:
-        raise HTTPException(
-            status_code=401,
-            detail="Incorrect username or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    return await login(db, form_data.username, form_data.password)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Merchant Query System"}
 
 @app.get("/api/merchants/", response_model=PaginatedResponse)
-def get_merchants(
+async def get_merchants(
     institution_id: Optional[str] = None,
     institution: Optional[str] = None,
     merchant_id: Optional[str] = None,
@@ -219,121 +135,231 @@ def get_merchants(
     max_transactions: Optional[int] = None,
     page: int = 1,
     page_size: int = 10,
-    db: SessionLocal = Depends(get_db)
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None,
+    data_date: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
+    # 传入 cursor 时使用游标分页（空字符串表示第一页），按 id 定位，
+    # 翻到第N页与第1页代价相同；游标分页默认不统计总数（include_total=true 时才统计），偏移分页总是统计
     # 记录查询参数
-    logger.info(f"开始查询 - 参数: institution_id={institution_id}, institution={institution}, merchant_id={merchant_id}, merchant_name={merchant_name}, page={page}, page_size={page_size}")
-    
-    # 构建查询
-    query = db.query(Merchant)
-    
-    # 记录SQL查询
-    conditions = []
-    
-    # 机构查询
-    if institution_id:
-        # 使用精确匹配机构号
-        conditions.append(Merchant.institution_id == institution_id)
-        logger.info(f"添加条件: institution_id = {institution_id}")
-    
-    if institution:
-        # 使用精确匹配机构名称
-        conditions.append(Merchant.institution == institution)
-        logger.info(f"添加条件: institution = {institution}")
-    
-    # 商户查询
-    if merchant_id:
-        # 使用精确匹配商户号
-        conditions.append(Merchant.merchant_id == merchant_id)
-        logger.info(f"添加条件: merchant_id = {merchant_id}")
-    
-    if merchant_name:
-        # 使用模糊匹配商户名称
-        conditions.append(Merchant.merchant_name.like(f"%{merchant_name}%"))
-        logger.info(f"添加条件: merchant_name like %{merchant_name}%")
-    
-    # 应用所有条件（使用OR连接）
-    if conditions:
-        from sqlalchemy import or_
-        query = query.filter(or_(*conditions))
-        logger.info("使用OR条件连接所有查询条件")
+    logger.debug(
+        "开始查询 - 参数: institution_id=%s, institution=%s, merchant_id=%s, merchant_name=%s, page=%s, page_size=%s",
+        institution_id, institution, merchant_id, merchant_name, page, page_size,
+    )
     
-    if min_transactions is not None:
-        query = query.filter(Merchant.transaction_count >= min_transactions)
-        logger.info(f"添加条件: transaction_count >= {min_transactions}")
-    if max_transactions is not None:
-        query = query.filter(Merchant.transaction_count <= max_transactions)
-        logger.info(f"添加条件: transaction_count <= {max_transactions}")
+    need_total = cursor is None or bool(include_total)
+
+    # 先查缓存：键为规范化后的查询参数，数据代次变化（上传/回滚）后自动失效
+    generation, current_date = await db.run_sync(generation_and_date)
+    cache_key = make_key(
+        "merchants",
+        institution_id=institution_id, institution=institution,
+        merchant_id=merchant_id, merchant_name=merchant_name,
+        min_transactions=min_transactions, max_transactions=max_transactions,
+        page=page, page_size=page_size, cursor=cursor, include_total=need_total, data_date=data_date,
+    )
+    cached = result_cache.get(cache_key, generation)
+    if cached is not None:
+        logger.debug("命中查询缓存")
+        observe_rows("/api/merchants/", "cache", len(cached["items"]))
+        return json_response(cached)
     
-    # 计算总记录数
-    total_count = query.count()
-    logger.info(f"查询结果总记录数: {total_count}")
+    last_id = None
+    if cursor is not None:
+        try:
+            last_id = decode_cursor(cursor)
+        except CursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    # 应用分页
-    offset = (page - 1) * page_size
-    query = query.offset(offset).limit(page_size)
-    logger.info(f"应用分页: offset={offset}, limit={page_size}")
+    # 指定 data_date 时查询对应日期的历史分区
+    partition = None
+    model = Merchant
+    if data_date:
+        try:
+            partition = await db.run_sync(partition_for, data_date)
+        except HistoryError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        model = partition_columns(partition["table_name"])
+    filters = dict(
+        institution_id=institution_id, institution=institution,
+        merchant_id=merchant_id, merchant_name=merchant_name,
+        min_transactions=min_transactions, max_transactions=max_transactions,
+    )
     
     # 执行查询
     try:
-        # 记录当前数据库中的一些示例数据
-        sample_data = db.query(Merchant).limit(5).all()
-        logger.info("数据库中的示例数据:")
-        for data in sample_data:
-            logger.info(f"机构: {data.institution}, 机构号: {data.institution_id}, 商户名: {data.merchant_name}, 商户号: {data.merchant_id}")
-
-        results = query.all()
-        logger.info(f"查询执行成功，找到 {len(results)} 条记录")
-        
-        # 记录一些示例数据
-        if results:
-            logger.info(f"查询结果示例: {results[0].__dict__}")
-            
-            # 记录数据统计信息
-            transaction_counts = [r.transaction_count for r in results]
-            if transaction_counts:
-                logger.info(f"交易笔数统计 - 最小: {min(transaction_counts)}, 最大: {max(transaction_counts)}, 平均: {sum(transaction_counts)/len(transaction_counts):.2f}")
-        else:
-            # 如果没有结果，尝试查询所有数据
-            all_results = db.query(Merchant).all()
-            logger.info(f"当前数据库总记录数: {len(all_results)}")
-            if all_results:
-                logger.info(f"数据库示例数据: {all_results[0].__dict__}")
+        page_result = None
+        source = "snapshot"
+        if QUERY_ENGINE == "snapshot" and partition is None:
+            page_result = await run_in_threadpool(
+                snapshot_page, generation, page, page_size, last_id, need_total, **filters
+            )
+        if page_result is None:
+            source = "sql"
+            page_result = await db.run_sync(
+                query_merchants_page, page, page_size, last_id, need_total,
+                merchant_conditions(model=model, **filters), model
+            )
+        items, total_count, next_cursor = page_result
+        observe_rows("/api/merchants/", source, len(items))
+        logger.debug("查询执行成功，找到 %d 条记录", len(items))
         
-        # 设置数据日期
-        data_date = "4月27日"  # 这里可以根据实际情况设置
+        # 设置数据日期：历史分区使用分区日期，否则为当前数据日期（进程内缓存，不查询数据库）
+        data_date = partition["data_date"] if partition else current_date
         
         # 返回结果和分页信息
-        return {
-            "items": results,
+        response = {
+            "items": items,
             "total": total_count,
             "page": page,
             "page_size": page_size,
-            "total_pages": (total_count + page_size - 1) // page_size,
-            "data_date": data_date
+            "total_pages": (total_count + page_size - 1) // page_size if total_count is not None else None,
+            "data_date": data_date,
+            "next_cursor": next_cursor
         }
+        result_cache.set(cache_key, generation, response)
+        # 行数据来自数据库、结构固定，默认由 orjson 直接序列化（见 responses.py）
+        return json_response(response)
     except Exception as e:
-        logger.error(f"查询执行失败: {str(e)}")
+        logger.error("查询执行失败: %s", e)
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
+# 导出接口需定义在 /api/merchants/{merchant_id} 之前
+@app.get("/api/merchants/export")
+def export_merchants(
+    institution_id: Optional[str] = None,
+    institution: Optional[str] = None,
+    merchant_id: Optional[str] = None,
+    merchant_name: Optional[str] = None,
+    min_transactions: Optional[int] = None,
+    max_transactions: Optional[int] = None,
+    format: str = "xlsx",
+):
+    if format not in EXPORT_WRITERS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    logger.info(
+        "开始导出 - 格式: %s, 参数: institution_id=%s, institution=%s, merchant_id=%s, merchant_name=%s",
+        format, institution_id, institution, merchant_id, merchant_name,
+    )
+    
+    statement = select(
+        Merchant.merchant_id,
+        Merchant.merchant_name,
+        Merchant.institution,
+        Merchant.institution_id,
+        Merchant.transaction_count,
+    ).where(*merchant_conditions(
+        institution_id, institution, merchant_id, merchant_name, min_transactions, max_transactions
+    )).order_by(Merchant.id)
+    
+    # 在生成器内部自行打开只读连接，按批读取，整个结果集不会同时驻留内存；不占用唯一的写连接，上传期间也能导出
+    def iter_rows():
+        with read_engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(statement)
+            for partition in result.partitions(EXPORT_BATCH_SIZE):
+                yield from partition
+    
+    return StreamingResponse(
+        EXPORT_WRITERS[format](iter_rows()),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": content_disposition(f"商户数据.{format}")}
+    )
+
+# 按商户号批量查询：请求体为 JSON（["id", ...] 或 {"merchant_ids": [...]}），
+# 或 multipart 上传的 .xlsx/.csv/.txt 文件（字段名 file）。结果以 NDJSON 流式返回，
+# 每个商户号一行 {"merchant_id", "found", "merchant"}，最后一行为汇总
+@app.post("/api/merchants/batch")
+async def batch_get_merchants(request: Request):
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            file = form.get("file")
+            if file is None or isinstance(file, str):
+                raise BatchLookupError("Missing file field")
+            spool_path = await spool_upload(file)
+            try:
+                merchant_ids = await run_in_threadpool(
+                    lambda: normalize_ids(ids_from_file(spool_path, file.filename))
+                )
+            finally:
+                os.remove(spool_path)
+        else:
+            try:
+                payload = await request.json()
+            except ValueError:
+                raise BatchLookupError("Invalid JSON body")
+            merchant_ids = normalize_ids(ids_from_json(payload))
+    except BatchLookupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("批量查询商户: %s 个商户号", len(merchant_ids))
+    
+    # 按块执行 merchant_id IN (...)，每块走 merchant_id 唯一索引；在生成器内部打开只读连接
+    def iter_results():
+        with read_engine.connect() as conn:
+            def find(chunk):
+                statement = select(*(getattr(Merchant, field) for field in MERCHANT_FIELDS)).where(
+                    Merchant.merchant_id.in_(chunk)
+                )
+                return {row.merchant_id: dict(row._mapping) for row in conn.execute(statement)}
+            yield from iter_ndjson(merchant_ids, find)
+    
+    return StreamingResponse(iter_results(), media_type=NDJSON_MEDIA_TYPE)
+
 @app.get("/api/merchants/{merchant_id}", response_model=MerchantResponse)
-def get_merchant(merchant_id: str, db: SessionLocal = Depends(get_db)):
-    logger.info(f"开始查询商户详情 - 商户号: {merchant_id}")
+async def get_merchant(merchant_id: str, db: AsyncSession = Depends(get_async_db)):
+    logger.debug("开始查询商户详情 - 商户号: %s", merchant_id)
     try:
-        merchant = db.query(Merchant).filter(Merchant.merchant_id == merchant_id).first()
+        generation = await db.run_sync(get_generation)
+        cache_key = make_key("merchant", merchant_id=merchant_id)
+        cached = result_cache.get(cache_key, generation)
+        if cached is not None:
+            return cached
+        
+        result = await db.execute(select(Merchant).where(Merchant.merchant_id == merchant_id))
+        merchant = result.scalars().first()
         if merchant is None:
-            logger.warning(f"未找到商户号: {merchant_id}")
+            logger.debug("未找到商户号: %s", merchant_id)
             raise HTTPException(status_code=404, detail="Merchant not found")
-        logger.info(f"找到商户: {merchant.__dict__}")
-        return merchant
+        response = merchant_to_dict(merchant)
+        logger.debug("找到商户: %s", response)
+        result_cache.set(cache_key, generation, response)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"查询商户详情失败: {str(e)}")
+        logger.error("查询商户详情失败: %s", e)
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
+def run_upload_job(job_id: str, spool_path: str, formatted_date: Optional[str], mode: str):
+    try:
+        upload_jobs.run(job_id, ingest_upload, spool_path, formatted_date, mode)
+    finally:
+        os.remove(spool_path)
+
+def run_batch_job(job_id: str, files: List[tuple], sheets: Optional[List[str]], formatted_date: Optional[str]):
+    try:
+        upload_jobs.run(job_id, ingest_batch, files, sheets, formatted_date)
+    finally:
+        for path, _ in files:
+            os.remove(path)
+
+def job_response(job: dict) -> dict:
+    job = dict(job)
+    job["job_id"] = job.pop("id")
+    return job
+
 @app.post("/api/upload/")
-async def upload_file(file: UploadFile = File(...), current_user: UserDB = Depends(get_current_active_user)):
+async def upload_file(
+    file: UploadFile = File(...),
+    mode: str = INGEST_MODE,
+    current_user: Principal = Depends(get_current_active_user)
+):
+    # mode=delta 时只写入与现有数据相比新增/变化/删除的商户，任务结果中返回各自的行数
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
+    if mode not in INGEST_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported upload mode: {mode}")
     
     try:
         # 检查文件格式
@@ -341,174 +367,232 @@ async def upload_file(file: UploadFile = File(...), current_user: UserDB = Depen
             raise HTTPException(status_code=400, detail="Only Excel files are allowed")
         
         # 尝试从文件名中提取日期（如果文件名符合格式）
-        formatted_date = None
-        filename = file.filename
-        logger.info(f"上传文件名: {filename}")
-        
-        if filename.startswith("未月活-") and filename.endswith(".xlsx"):
-            try:
-                # 修复日期提取逻辑
-                date_str = filename[3:-5]  # 提取 MMDD 部分
-                logger.info(f"提取的日期字符串: {date_str}")
-                
-                # 处理可能的负号
-                if date_str.startswith('-'):
-                    date_str = date_str[1:]  # 去掉负号
-                    logger.info(f"去掉负号后的日期字符串: {date_str}")
-                
-                # 确保日期字符串长度正确
-                if len(date_str) == 4:
-                    month = int(date_str[:2])
-                    day = int(date_str[2:])
-                    if 1 <= month <= 12 and 1 <= day <= 31:
-                        formatted_date = f"{month}月{day}日"
-                        logger.info(f"从文件名解析出日期: {formatted_date}")
-                    else:
-                        logger.warning(f"解析出的月份或日期无效: 月={month}, 日={day}")
-                else:
-                    logger.warning(f"日期字符串长度不正确: {date_str}, 长度: {len(date_str)}")
-            except (ValueError, IndexError) as e:
-                logger.error(f"解析文件名日期失败: {str(e)}")
-                pass  # 如果解析失败，继续使用原有功能
-        else:
-            logger.info(f"文件名不符合格式要求，不解析日期")
-        
-        # 读取Excel文件
-        contents = await file.read()
-        df = pd.read_excel(BytesIO(contents))
-        
-        # 记录上传的数据信息
-        logger.info(f"上传文件: {file.filename}")
-        logger.info(f"数据形状: {df.shape}")
-        logger.info(f"列名: {df.columns.tolist()}")
-        
-        # 重命名列（如果需要）
-        column_mapping = {
-            'counts': '有效交易笔数'
-        }
-        df = df.rename(columns=column_mapping)
-        
-        # 验证必要的列
-        required_columns = ['商户号', '商户名称', '机构', '机构号', '有效交易笔数']
-        if not all(col in df.columns for col in required_columns):
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing required columns: {', '.join(missing_columns)}"
-            )
+        formatted_date = parse_data_date(file.filename)
         
-        # 清空现有数据
-        db = SessionLocal()
-        db.query(Merchant).delete()
-        logger.info("已清空现有数据")
+        # 上传内容先分块落盘后立即返回任务号，解析、校验、写入影子表和原子替换在后台任务中完成，
+        # 通过 GET /api/upload/{job_id} 查询进度
+        logger.info("上传文件: %s", file.filename)
+        spool_path = await spool_upload(file)
+        job = upload_jobs.create(file.filename, formatted_date, current_user.username)
+        ingest_pool.submit(run_upload_job, job["id"], spool_path, formatted_date, mode)
+        logger.info("已创建上传任务: %s", job['id'])
         
-        # 插入新数据
-        success_count = 0
-        for _, row in df.iterrows():
-            try:
-                merchant = Merchant(
-                    merchant_id=str(row['商户号']),
-                    merchant_name=str(row['商户名称']),
-                    institution=str(row['机构']),
-                    institution_id=str(row['机构号']),
-                    transaction_count=int(row['有效交易笔数'])
-                )
-                db.add(merchant)
-                success_count += 1
-                if success_count % 100 == 0:  # 每100条记录记录一次
-                    logger.info(f"已处理 {success_count} 条记录")
-            except Exception as e:
-                logger.error(f"处理行数据失败: {row}, 错误: {str(e)}")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Error processing row: {str(e)}"
-                )
-        
-        # 如果成功解析了日期，则更新数据日期
-        if formatted_date:
-            try:
-                logger.info(f"准备更新数据日期为: {formatted_date}")
-                # 检查data_date表是否存在，如果不存在则创建
-                db.execute(text("""
-                    CREATE TABLE IF NOT EXISTS data_date (
-                        id INTEGER PRIMARY KEY,
-                        date TEXT
-                    )
-                """))
-                logger.info("确保data_date表存在")
-                
-                # 更新或插入数据日期
-                db.execute(text("""
-                    INSERT OR REPLACE INTO data_date (id, date)
-                    VALUES (1, :date)
-                """), {"date": formatted_date})
-                logger.info("执行更新数据日期SQL")
-                
-                db.commit()
-                logger.info("提交事务")
-                
-                # 验证数据日期是否更新成功
-                result = db.execute(text("SELECT date FROM data_date WHERE id = 1")).fetchone()
-                logger.info(f"验证数据日期更新结果: {result}")
-                
-                if result and result[0] == formatted_date:
-                    logger.info(f"数据日期更新成功: {formatted_date}")
-                else:
-                    logger.warning(f"数据日期更新可能失败，当前值: {result[0] if result else 'None'}")
-            except Exception as e:
-                logger.error(f"更新数据日期失败: {str(e)}")
-                # 继续执行，不影响上传功能
-        else:
-            logger.info("没有解析出日期，不更新数据日期")
-        
-        logger.info(f"成功上传 {success_count} 条记录")
-        
-        # 验证数据是否成功写入
-        check_db_connection()
-        
-        return {
-            "message": f"Data uploaded successfully, {success_count} records processed",
-            "data_date": formatted_date if formatted_date else "未更新"
-        }
+        return JSONResponse(status_code=202, content={
+            "message": "Upload accepted",
+            "data_date": formatted_date if formatted_date else "未更新",
+            **job_response(job)
+        })
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"上传错误: {str(e)}")
+        logger.error("上传错误: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    sheets: Optional[str] = Form(None),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    # sheets 为逗号分隔的工作表名称，对每个文件生效；不传时导入每个文件的全部工作表
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    for file in files:
+        if not file.filename.endswith('.xlsx'):
+            raise HTTPException(status_code=400, detail=f"Only Excel files are allowed: {file.filename}")
+    
+    # 数据日期取最后一个能从文件名解析出日期的文件
+    formatted_date = None
+    for file in files:
+        formatted_date = parse_data_date(file.filename) or formatted_date
+    sheet_names = [name.strip() for name in sheets.split(",") if name.strip()] if sheets else None
+    
+    # 任一文件落盘失败或任务创建失败时删除已落盘的文件，任务提交后由 run_batch_job 负责删除
+    spooled = []
+    try:
+        for file in files:
+            spooled.append((await spool_upload(file), file.filename))
+        job = upload_jobs.create(", ".join(file.filename for file in files), formatted_date, current_user.username)
+        ingest_pool.submit(run_batch_job, job["id"], spooled, sheet_names, formatted_date)
+    except BaseException:
+        for path, _ in spooled:
+            os.remove(path)
+        raise
+    logger.info("已创建批量导入任务: %s, 文件数 %s", job['id'], len(files))
+    
+    return JSONResponse(status_code=202, content={
+        "message": "Batch upload accepted",
+        "data_date": formatted_date if formatted_date else "未更新",
+        **job_response(job)
+    })
+
+@app.get("/api/upload/{job_id}")
+def get_upload_job(job_id: str, current_user: Principal = Depends(get_current_active_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job_response(job)
+
+@app.post("/api/upload/{job_id}/cancel")
+def cancel_upload_job(job_id: str, current_user: Principal = Depends(get_current_active_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    if job["status"] in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Upload job already {job['status']}")
+    return job_response(upload_jobs.request_cancel(job_id))
+
+@app.post("/api/upload/rollback")
+def rollback_upload(current_user: Principal = Depends(get_current_active_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # 写连接被上传任务占用时等待 pool_timeout 后放弃，返回 503 让客户端稍后重试
+    try:
+        raw_conn = engine.raw_connection()
+    except PoolTimeoutError:
+        raise HTTPException(status_code=503, detail="Another upload is in progress, retry later", headers={"Retry-After": "5"})
+    try:
+        generation = rollback_generation(raw_conn)
+        refresh_institution_summary(raw_conn, generation)
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        raw_conn.close()
+    
+    check_db_connection()
+    return {"message": "Rolled back to previous data", "generation": generation}
+
+@app.get("/api/history/partitions")
+def get_history_partitions(db: SessionLocal = Depends(get_db)):
+    return list_partitions(db.connection().connection)
+
+@app.get("/api/history/deltas")
+def get_period_deltas(
+    previous: Optional[str] = None,
+    current: Optional[str] = None,
+    institution_id: Optional[str] = None,
+    institution: Optional[str] = None,
+    merchant_id: Optional[str] = None,
+    changed_only: bool = False,
+    order: str = "desc",
+    page: int = 1,
+    page_size: int = 50,
+    db: SessionLocal = Depends(get_db)
+):
+    # 两个数据日期之间各商户交易笔数的变化；默认对比最近两个历史分区
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail=f"Unsupported order: {order}")
+    conn = db.connection().connection
+    try:
+        partitions = list_partitions(conn)
+        current_partition = find_partition(conn, current) if current else (partitions[0] if partitions else None)
+        if previous:
+            previous_partition = find_partition(conn, previous)
+        else:
+            older = [p for p in partitions if current_partition and p["period"] < current_partition["period"]]
+            previous_partition = older[0] if older else None
+    except HistoryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if current_partition is None or previous_partition is None:
+        raise HTTPException(status_code=404, detail="At least two historical data dates are required")
+    
+    # 缓存键使用解析后的分区（含保存时间）：同一日期重新上传、新增分区时自动失效
+    generation = get_generation(db)
+    cache_key = make_key(
+        "deltas",
+        previous=f"{previous_partition['period']}@{previous_partition['archived_at']}",
+        current=f"{current_partition['period']}@{current_partition['archived_at']}",
+        institution_id=institution_id, institution=institution, merchant_id=merchant_id,
+        changed_only=changed_only, order=order, page=page, page_size=page_size,
+    )
+    cached = result_cache.get(cache_key, generation)
+    if cached is not None:
+        return cached
+    
+    response = period_deltas(
+        conn, previous_partition, current_partition, page, page_size, changed_only, order,
+        institution_id=institution_id, institution=institution, merchant_id=merchant_id,
+    )
+    result_cache.set(cache_key, generation, response)
+    return response
+
+@app.get("/api/institutions/summary")
+def get_institution_summary(
+    institution_id: Optional[str] = None,
+    institution: Optional[str] = None
+):
+    # 各机构的商户数、交易笔数合计/最小/最大/平均及分布，直接读取上传时预先计算的汇总表；
+    # 汇总表落后于当前数据代次时（如命令行导入后）返回现有结果并标记 stale，补算交给 ingest 线程池
+    raw_conn = read_engine.raw_connection()
+    try:
+        stale = summary_generation(raw_conn) != current_generation(raw_conn)
+        if stale:
+            schedule_summary_refresh()
+        summary = institution_summary(raw_conn, institution_id, institution)
+    finally:
+        raw_conn.close()
+    summary["stale"] = stale
+    return summary
+
+# 汇总表补算与上传排在同一个 ingest 线程池中，同一时间只排队一个
+_summary_refresh = None
+_summary_refresh_lock = threading.Lock()
+
+def schedule_summary_refresh():
+    global _summary_refresh
+    with _summary_refresh_lock:
+        if _summary_refresh is None or _summary_refresh.done():
+            _summary_refresh = ingest_pool.submit(refresh_stale_summary)
+
+def refresh_stale_summary():
+    try:
+        raw_conn = engine.raw_connection()
+        try:
+            ensure_institution_summary(raw_conn)
+        finally:
+            raw_conn.close()
+    except Exception as e:
+        logger.error("补算机构汇总表失败: %s", e)
+
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus 文本格式，每个 worker 进程各自统计
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    return result_cache.stats()
+
+@app.get("/api/diagnostics/summary")
+def get_table_summary(db: SessionLocal = Depends(get_db)):
+    return table_summary.get(db)
+
 @app.get("/api/data-date")
-async def get_data_date(db: SessionLocal = Depends(get_db)):
+async def get_data_date(request: Request, db: AsyncSession = Depends(get_async_db)):
+    # 数据日期按数据代次缓存在进程内（data_date 表在启动时创建）；
+    # ETag 为数据代次，浏览器带 If-None-Match 重新验证时未变化直接返回 304
     try:
-        logger.info("开始获取数据日期")
-        # 检查data_date表是否存在，如果不存在则创建
-        db.execute(text("""
-            CREATE TABLE IF NOT EXISTS data_date (
-                id INTEGER PRIMARY KEY,
-                date TEXT
-            )
-        """))
-        logger.info("确保data_date表存在")
-        
-        # 查询数据日期
-        result = db.execute(text("SELECT date FROM data_date WHERE id = 1")).fetchone()
-        logger.info(f"查询数据日期结果: {result}")
-        
-        if result and result[0]:
-            logger.info(f"返回数据日期: {result[0]}")
-            return {"date": result[0]}
-        
-        # 如果没有设置日期，设置默认值并返回
-        default_date = "4月27日"  # 设置默认日期
-        logger.info(f"没有找到数据日期，设置默认值: {default_date}")
-        db.execute(text("""
-            INSERT OR REPLACE INTO data_date (id, date)
-            VALUES (1, :date)
-        """), {"date": default_date})
-        db.commit()
-        logger.info("已更新默认数据日期")
-        
-        return {"date": default_date}
+        generation, date = await db.run_sync(generation_and_date)
     except Exception as e:
-        logger.error(f"获取数据日期失败: {str(e)}")
-        return {"date": "4月27日"}  # 即使出错也返回默认日期
+        logger.error("获取数据日期失败: %s", e)
+        return {"date": data_date_cache.default}  # 即使出错也返回默认日期
+    
+    etag = f'W/"{generation}"'
+    headers = {"ETag": etag, "Cache-Control": DATA_DATE_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"date": date}, headers=headers)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await dispose_engines()
+    ingest_pool.shutdown(wait=False)
+    auth_pool.shutdown(wait=False)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,182 @@
+import bisect
+import os
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+
+from sqlalchemy import event
+
+# 进程内的性能指标，GET /metrics 以 Prometheus 文本格式输出（每个 worker 各自统计，由 Prometheus 按实例汇总）：
+# - 各路由的请求数和耗时分布（路由按模板统计，如 /api/merchants/{merchant_id}）；
+# - 经 SQLAlchemy 执行的 SQL 语句数和耗时（上传批量写入使用 DB-API 连接，不在其中）；
+# - 查询接口返回的行数；
+# - 上传各阶段耗时：parse（读取 Excel 并校验）、insert（写入）、index（建索引）等
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+LATENCY_BUCKETS = [
+    float(edge) for edge in os.getenv(
+        "METRICS_LATENCY_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",") if edge.strip()
+]
+ROWS_BUCKETS = [0, 1, 10, 50, 100, 500, 1000, 5000, 10000]
+PHASE_BUCKETS = [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        # 每组标签：[各分桶计数（不累计）..., +Inf 分桶计数, 总和]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in values:
+            cumulative = 0
+            for edge, count in zip(self.buckets + [float("inf")], counts):
+                cumulative += count
+                le = f'le="{_number(float(edge))}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(counts[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+sql_statements = registry.register(Counter(
+    "sql_statements_total", "SQL statements executed through SQLAlchemy", ("engine", "operation")))
+sql_statement_duration = registry.register(Histogram(
+    "sql_statement_duration_seconds", "SQL statement latency", ("engine", "operation")))
+rows_returned = registry.register(Histogram(
+    "query_rows_returned", "Rows returned per query response", ("route", "source"), ROWS_BUCKETS))
+upload_phase_duration = registry.register(Histogram(
+    "upload_phase_duration_seconds", "Time spent in each upload phase", ("phase",), PHASE_BUCKETS))
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "CREATE", "DROP", "ALTER", "PRAGMA", "WITH", "EXPLAIN"}
+
+
+def _operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine, name: str):
+    # 同步引擎直接传入；异步引擎传入 async_engine.sync_engine
+    if not METRICS_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        operation = _operation(statement)
+        sql_statements.inc(engine=name, operation=operation)
+        sql_statement_duration.observe(elapsed, engine=name, operation=operation)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # 执行失败的语句不会触发 after_cursor_execute，丢弃对应的开始时间
+        starts = context.connection.info.get("metrics_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    if METRICS_ENABLED:
+        http_requests.inc(method=method, route=route, status=status)
+        http_request_duration.observe(seconds, method=method, route=route)
+
+
+def observe_rows(route: str, source: str, rows: int):
+    if METRICS_ENABLED:
+        rows_returned.observe(rows, route=route, source=source)
+
+
+def observe_phase(phase: str, seconds: float):
+    if METRICS_ENABLED:
+        upload_phase_duration.observe(seconds, phase=phase)
@@ -0,0 +1,128 @@
+import logging
+
+from sqlalchemy import Boolean, Column, Integer, String, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from aggregates import INSTITUTION_SUMMARY_DDL, ensure_institution_summary
+from database import DATABASE_BACKEND, async_read_engine, read_engine, write_engine
+from history import DATA_PARTITIONS_DDL
+from ingest import DATA_DATE_DDL, DATA_GENERATION_DDL, MERCHANT_FIELDS, ensure_indexes
+from search import ensure_search_index
+from storage import MERCHANTS_DDL
+
+logger = logging.getLogger(__name__)
+
+# 表结构和数据库会话，backend/main.py 与 backend/app/main.py 共用同一套，
+# 两个服务可以指向同一个数据库，索引、全文索引和汇总表只在这里维护。
+# engine 为唯一的写连接，上传、回滚、建表等写操作都经过它；查询使用只读连接池
+engine = write_engine
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+Base = declarative_base()
+
+# 异步只读连接池（aiosqlite / asyncpg），供 async 路由使用，查询期间不阻塞事件循环；
+# 上传、导出等批量操作仍使用同步连接，在线程池中执行
+async_engine = async_read_engine
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# SQLAlchemy 模型
+class UserDB(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, index=True)
+    email = Column(String, unique=True, index=True)
+    hashed_password = Column(String)
+    is_admin = Column(Boolean, default=False)
+
+
+class Merchant(Base):
+    __tablename__ = "merchants"
+
+    id = Column(Integer, primary_key=True, index=True)
+    merchant_id = Column(String, unique=True, index=True)
+    merchant_name = Column(String)
+    institution = Column(String)
+    institution_id = Column(String)
+    transaction_count = Column(Integer)
+
+
+def _columns(inspector, table_name: str) -> set:
+    return {column["name"] for column in inspector.get_columns(table_name)}
+
+
+def upgrade_legacy_tables():
+    # 旧版 backend/app 在同一个 SQLite 数据库中建的表与这里冲突：
+    # users(username, password) 迁移为 users(id, username, email, hashed_password, is_admin)，原有用户均为管理员；
+    # merchants(merchant_id 主键、没有 id 列) 按原顺序重建，全文索引随后由 ensure_search_index 重建
+    if DATABASE_BACKEND != "sqlite":
+        return
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        if inspector.has_table("users") and "hashed_password" not in _columns(inspector, "users"):
+            conn.execute(text("ALTER TABLE users RENAME TO users_legacy"))
+            UserDB.__table__.create(conn)
+            conn.execute(text(
+                "INSERT INTO users (username, hashed_password, is_admin) "
+                "SELECT username, password, 1 FROM users_legacy"
+            ))
+            conn.execute(text("DROP TABLE users_legacy"))
+            logger.info("已迁移旧版用户表")
+        if inspector.has_table("merchants") and "id" not in _columns(inspector, "merchants"):
+            fields = ", ".join(MERCHANT_FIELDS)
+            conn.execute(text("ALTER TABLE merchants RENAME TO merchants_legacy"))
+            conn.execute(text(MERCHANTS_DDL.format(table="merchants")))
+            conn.execute(text(f"INSERT INTO merchants ({fields}) SELECT {fields} FROM merchants_legacy ORDER BY rowid"))
+            conn.execute(text("DROP TABLE merchants_legacy"))
+            conn.execute(text("DROP TABLE IF EXISTS merchants_fts"))
+            logger.info("已迁移旧版商户表")
+
+
+def init_schema():
+    # 建表，并补建查询所需的索引、全文索引和机构汇总表（旧数据库升级时使用），可重复执行
+    upgrade_legacy_tables()
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text(DATA_DATE_DDL))
+        conn.execute(text(DATA_GENERATION_DDL))
+        conn.execute(text(DATA_PARTITIONS_DDL))
+        conn.execute(text(INSTITUTION_SUMMARY_DDL))
+
+    raw_conn = engine.raw_connection()
+    try:
+        ensure_indexes(raw_conn)
+        ensure_search_index(raw_conn)
+        ensure_institution_summary(raw_conn)
+    finally:
+        raw_conn.close()
+
+
+# 检查数据库连接
+def check_db_connection():
+    try:
+        with read_engine.connect() as conn:
+            table_exists = inspect(conn).has_table("merchants")
+            if table_exists:
+                count = conn.execute(text("SELECT COUNT(*) FROM merchants")).fetchone()[0]
+                logger.info("数据库连接成功，merchants表存在，当前记录数: %s", count)
+            else:
+                logger.warning("数据库连接成功，但merchants表不存在")
+    except Exception as e:
+        logger.error("数据库连接检查失败: %s", e)
+
+
+# 数据库依赖（只读）
+def get_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
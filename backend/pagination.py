@@ -0,0 +1,26 @@
+import base64
+import json
+
+
+class CursorError(ValueError):
+    """游标无法解析"""
+
+
+# 游标内容为上一页最后一条记录的 id，对客户端不透明
+def encode_cursor(last_id: int) -> str:
+    raw = json.dumps({"id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    # 空字符串表示从第一条开始
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+    except (ValueError, KeyError, TypeError):
+        raise CursorError(f"Invalid cursor: {cursor}")
+    if not isinstance(last_id, int):
+        raise CursorError(f"Invalid cursor: {cursor}")
+    return last_id
@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# 认证快速路径：
+# - 登录签发的令牌中带上用户 ID、邮箱、是否管理员（AUTH_EMBED_CLAIMS=1），签名校验通过后直接使用，不查询 users 表；
+# - 校验结果按令牌缓存在进程内，直到令牌过期为止，同一令牌的后续请求不再解码 JWT；
+# - 没有这些声明的旧令牌查询一次 users 表后同样缓存。
+# 用户被删除或取消管理员后，已签发的令牌最迟在过期（ACCESS_TOKEN_EXPIRE_MINUTES）时失效
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_EMBED_CLAIMS = os.getenv("AUTH_EMBED_CLAIMS", "1") == "1"
+
+
+class Principal:
+    # 已认证的用户，接口中只用到用户名和是否管理员，不持有数据库会话
+    def __init__(self, username: str, is_admin: bool, user_id: Optional[int] = None, email: Optional[str] = None):
+        self.username = username
+        self.is_admin = is_admin
+        self.id = user_id
+        self.email = email
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(user.username, bool(user.is_admin), user.id, user.email)
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> Optional["Principal"]:
+        # 令牌中没有 adm 声明（旧令牌或关闭了 AUTH_EMBED_CLAIMS）时返回 None，需要查询数据库
+        if "adm" not in payload:
+            return None
+        return cls(payload["sub"], bool(payload["adm"]), payload.get("uid"), payload.get("email"))
+
+    def claims(self) -> dict:
+        return {"sub": self.username, "uid": self.id, "email": self.email, "adm": self.is_admin}
+
+
+class PrincipalCache:
+    # 进程内 LRU，键为令牌，条目在令牌的 exp 时间过期
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, token: str, principal: Principal, expires_at: float):
+        with self._lock:
+            self._entries[token] = (expires_at, principal)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache()
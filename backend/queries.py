@@ -0,0 +1,186 @@
+import logging
+from typing import Optional
+
+from sqlalchemy import Column, MetaData, Table, func, or_, select, union
+
+from cache import data_date_cache, get_generation
+from database import DATABASE_BACKEND
+from diagnostics import log_query_diagnostics, should_log_diagnostics
+from history import find_partition
+from ingest import MERCHANT_FIELDS
+from models import Merchant, ReadSessionLocal
+from pagination import encode_cursor
+from responses import rows_to_dicts
+from search import can_use_search_index, search_ids
+from snapshot import snapshot_engine
+
+logger = logging.getLogger(__name__)
+
+# 商户查询的筛选条件和分页，两个服务共用：
+# - merchant_conditions：backend/main.py 的语义，机构号/机构/商户号精确匹配、商户名称模糊匹配，多个条件之间是 OR；
+# - keyword_conditions：backend/app/main.py 的语义，每个关键字同时模糊匹配两列，多个关键字之间是 AND。
+# 两者生成的条件都交给 query_merchants_page 执行，索引、全文索引和分页方式只在这里维护
+
+
+def merchant_to_dict(merchant: Merchant) -> dict:
+    return {field: getattr(merchant, field) for field in MERCHANT_FIELDS}
+
+
+def contains(column, keyword: str):
+    # 模糊匹配，与 SQLite 的 LIKE 一致，PostgreSQL 上不区分英文大小写（安装 pg_trgm 时走 trigram 索引）
+    if DATABASE_BACKEND == "postgresql":
+        return column.ilike(f"%{keyword}%")
+    return column.like(f"%{keyword}%")
+
+
+# 查询条件（get_merchants 与导出共用）
+def merchant_conditions(
+    institution_id: Optional[str] = None,
+    institution: Optional[str] = None,
+    merchant_id: Optional[str] = None,
+    merchant_name: Optional[str] = None,
+    min_transactions: Optional[int] = None,
+    max_transactions: Optional[int] = None,
+    model=Merchant,
+):
+    # model 为 Merchant 或历史分区表的列集合（table.c），两者按同名属性访问列
+    # 记录SQL查询
+    conditions = []
+
+    # 机构查询
+    if institution_id:
+        # 使用精确匹配机构号
+        conditions.append(model.institution_id == institution_id)
+        logger.debug("添加条件: institution_id = %s", institution_id)
+
+    if institution:
+        # 使用精确匹配机构名称
+        conditions.append(model.institution == institution)
+        logger.debug("添加条件: institution = %s", institution)
+
+    # 商户查询
+    if merchant_id:
+        # 使用精确匹配商户号
+        conditions.append(model.merchant_id == merchant_id)
+        logger.debug("添加条件: merchant_id = %s", merchant_id)
+
+    if merchant_name:
+        # 使用模糊匹配商户名称：关键字足够长时走 trigram 全文索引，结果与 LIKE 相同
+        if model is Merchant and can_use_search_index(merchant_name):
+            conditions.append(model.id.in_(search_ids("merchant_name", f"%{merchant_name}%")))
+        else:
+            conditions.append(contains(model.merchant_name, merchant_name))
+        logger.debug("添加条件: merchant_name like %%%s%%", merchant_name)
+
+    range_filters = []
+    if min_transactions is not None:
+        range_filters.append(model.transaction_count >= min_transactions)
+        logger.debug("添加条件: transaction_count >= %s", min_transactions)
+    if max_transactions is not None:
+        range_filters.append(model.transaction_count <= max_transactions)
+        logger.debug("添加条件: transaction_count <= %s", max_transactions)
+
+    # 多个条件之间是OR关系：改写成 id IN (... UNION ...)，
+    # 每个分支各自带上交易笔数范围，分别走 (列, transaction_count) 复合索引
+    if len(conditions) > 1:
+        branches = [select(model.id).where(condition, *range_filters) for condition in conditions]
+        logger.debug("使用UNION连接所有查询条件")
+        return [model.id.in_(union(*branches))]
+    return conditions + range_filters
+
+
+def keyword_conditions(
+    institution_id: Optional[str] = None,
+    institution: Optional[str] = None,
+    merchant_id: Optional[str] = None,
+    merchant_name: Optional[str] = None,
+    model=Merchant,
+):
+    # 机构号/机构关键字匹配 institution_id 或 institution，商户号/商户名称关键字匹配 merchant_id 或 merchant_name
+    conditions = []
+    for keyword in (institution_id, institution):
+        if keyword:
+            conditions.append(or_(contains(model.institution_id, keyword), contains(model.institution, keyword)))
+    for keyword in (merchant_id, merchant_name):
+        if not keyword:
+            continue
+        if model is Merchant and can_use_search_index(keyword):
+            # 关键字足够长时走 trigram 全文索引，结果与 LIKE 相同
+            pattern = f"%{keyword}%"
+            conditions.append(model.id.in_(union(search_ids("merchant_id", pattern), search_ids("merchant_name", pattern))))
+        else:
+            conditions.append(or_(contains(model.merchant_id, keyword), contains(model.merchant_name, keyword)))
+    return conditions
+
+
+def merchant_select(conditions=(), model=Merchant):
+    # 构建查询：Core select 只取需要的列，返回元组而不是 ORM 对象，同一套逻辑也用于历史分区表。
+    # id 放在最后一列，rows_to_dicts 按 MERCHANT_FIELDS 取前几列
+    return select(*(getattr(model, field) for field in MERCHANT_FIELDS), model.id).where(*conditions)
+
+
+# SQL 查询引擎：返回 (items, total, next_cursor)
+def query_merchants_page(db, page: int, page_size: int, last_id: Optional[int], need_total: bool,
+                         conditions=(), model=Merchant):
+    statement = merchant_select(conditions, model)
+
+    # 计算总记录数
+    total_count = None
+    if need_total:
+        total_count = db.execute(select(func.count()).select_from(statement.subquery())).scalar()
+        logger.debug("查询结果总记录数: %s", total_count)
+
+    # 应用分页
+    if last_id is not None:
+        # 多取一条用于判断是否还有下一页
+        statement = statement.where(model.id > last_id).order_by(model.id).limit(page_size + 1)
+        logger.debug("应用游标分页: id > %s, limit=%s", last_id, page_size)
+    else:
+        offset = max((page - 1) * page_size, 0)
+        statement = statement.order_by(model.id).offset(offset).limit(page_size)
+        logger.debug("应用分页: offset=%s, limit=%s", offset, page_size)
+
+    results = db.execute(statement).all()
+    next_cursor = None
+    if last_id is not None and len(results) > page_size:
+        results = results[:page_size]
+        next_cursor = encode_cursor(results[-1][-1])
+    items = rows_to_dicts(results)
+
+    # 示例数据和统计信息只在诊断模式（或抽样命中）时记录
+    if should_log_diagnostics():
+        log_query_diagnostics(db, items, statement)
+    return items, total_count, next_cursor
+
+
+# 历史分区表：与 merchants 同结构，按表名缓存 Table 对象
+_partition_metadata = MetaData()
+
+
+def partition_columns(table_name: str):
+    table = _partition_metadata.tables.get(table_name)
+    if table is None:
+        table = Table(table_name, _partition_metadata, *(Column(c.name, c.type) for c in Merchant.__table__.columns))
+    return table.c
+
+
+def generation_and_date(db):
+    generation = get_generation(db)
+    return generation, data_date_cache.get(db, generation)
+
+
+def generation_and_stored_date(db):
+    # 只取已导入数据自带的日期，没有时为空字符串（不使用 DEFAULT_DATA_DATE）
+    generation = get_generation(db)
+    return generation, data_date_cache.stored(db, generation) or ""
+
+
+def partition_for(db, data_date: str) -> dict:
+    return find_partition(db.connection().connection, data_date)
+
+
+# 快照引擎：加载快照和按列筛选都是CPU密集操作，整体放到线程池执行
+def snapshot_page(generation: int, page: int, page_size: int, last_id: Optional[int], need_total: bool, **filters):
+    with ReadSessionLocal() as db:
+        snapshot = snapshot_engine.get(db, generation)
+    return snapshot.page(page, page_size, last_id, need_total, **filters)
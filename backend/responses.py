@@ -0,0 +1,29 @@
+import os
+from typing import Iterable, List, Sequence
+
+from fastapi.responses import ORJSONResponse
+
+from ingest import MERCHANT_FIELDS
+
+# 查询接口的 JSON 响应方式：
+# - orjson：查询结果直接取列值元组组装成 dict（数据入库时已校验），由 orjson 一次性序列化，
+#   跳过 response_model 对每一行的 Pydantic 校验和 jsonable_encoder 转换，page_size 较大时明显更快；
+# - pydantic：交给 FastAPI 按 response_model 校验后序列化，排查数据问题时使用。
+# 两种方式输出的 JSON 完全相同，可用 bench_response.py 对比
+JSON_RESPONSE_MODE = os.getenv("JSON_RESPONSE_MODE", "orjson")
+JSON_RESPONSE_MODES = ("orjson", "pydantic")
+
+if JSON_RESPONSE_MODE not in JSON_RESPONSE_MODES:
+    raise ValueError(f"Unsupported JSON_RESPONSE_MODE: {JSON_RESPONSE_MODE}")
+
+
+def rows_to_dicts(rows: Iterable[Sequence], fields: Sequence[str] = MERCHANT_FIELDS) -> List[dict]:
+    # rows 为 Core 查询返回的元组，列顺序与 fields 一致
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def json_response(content):
+    # orjson 模式返回 Response，FastAPI 不再按 response_model 处理；否则原样返回交给 FastAPI
+    if JSON_RESPONSE_MODE == "orjson":
+        return ORJSONResponse(content)
+    return content
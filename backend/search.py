@@ -0,0 +1,86 @@
+import logging
+import re
+import sqlite3
+
+from sqlalchemy import column, select, table
+
+from storage import storage_for
+
+logger = logging.getLogger(__name__)
+
+# 商户号/商户名称的 trigram 全文索引（SQLite FTS5，需要 3.34+），rowid 与 merchants.id 一致。
+# 跟随 merchants 表一起在影子表上建立并改名替换：merchants_next_fts -> merchants_fts
+SEARCH_COLUMNS = ("merchant_id", "merchant_name")
+
+SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE {table} USING fts5("
+    + ", ".join(SEARCH_COLUMNS)
+    + ", tokenize='trigram')"
+)
+
+merchants_fts = table("merchants_fts", column("rowid"), *(column(name) for name in SEARCH_COLUMNS))
+
+_supported = None
+
+
+def search_table(table_name: str) -> str:
+    return f"{table_name}_fts"
+
+
+def search_index_supported(conn) -> bool:
+    # 检查当前 SQLite 是否支持 FTS5 trigram 分词（结果缓存）；其他数据库没有 FTS5，模糊查询直接用 LIKE
+    # 只缓存 SQLite 的检查结果，同一进程中的 PostgreSQL 连接不受影响
+    global _supported
+    if storage_for(conn).name != "sqlite":
+        return False
+    if _supported is None:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')")
+            cursor.execute("DROP TABLE temp.fts_probe")
+            _supported = True
+        except sqlite3.OperationalError as e:
+            logger.warning("SQLite 不支持 FTS5 trigram，模糊查询使用 LIKE 全表扫描: %s", e)
+            _supported = False
+        finally:
+            cursor.close()
+    return _supported
+
+
+def build_search_index(cursor, table_name: str):
+    # 基于 table_name 重新建立全文索引（rowid 兼容没有 id 列的旧表结构）
+    fts = search_table(table_name)
+    cursor.execute(f"DROP TABLE IF EXISTS {fts}")
+    cursor.execute(SEARCH_INDEX_DDL.format(table=fts))
+    cursor.execute(
+        f"INSERT INTO {fts} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+        f"SELECT rowid, {', '.join(SEARCH_COLUMNS)} FROM {table_name}"
+    )
+
+
+def ensure_search_index(conn, table_name: str = "merchants"):
+    # 旧数据库升级时补建全文索引
+    if not search_index_supported(conn):
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name IN (?, ?)", (table_name, search_table(table_name)))
+        existing = {row[0] for row in cursor.fetchall()}
+        if table_name in existing and search_table(table_name) not in existing:
+            cursor.execute("BEGIN")
+            build_search_index(cursor, table_name)
+            conn.commit()
+            logger.info("已建立全文索引 %s", search_table(table_name))
+    finally:
+        cursor.close()
+
+
+def can_use_search_index(keyword: str) -> bool:
+    # trigram 索引只对包含至少3个连续非通配符字符的 LIKE 模式有效，
+    # 更短的关键字（如两个汉字）在 FTS 上查不到结果，需要退回普通 LIKE
+    return bool(_supported) and any(len(part) >= 3 for part in re.split(r"[%_]", keyword))
+
+
+def search_ids(column_name: str, pattern: str):
+    # 返回 SELECT rowid FROM merchants_fts WHERE <column> LIKE :pattern，结果与原表 LIKE 一致
+    return select(merchants_fts.c.rowid).where(merchants_fts.c[column_name].like(pattern))
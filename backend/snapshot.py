@@ -0,0 +1,158 @@
+import logging
+import os
+import string
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from cache import get_generation
+from ingest import MERCHANT_FIELDS
+from pagination import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# 查询引擎：sql 直接查询数据库；snapshot 使用内存中的列式快照（按数据代次加载），
+# 快照无法精确表达的查询自动退回 sql
+QUERY_ENGINE = os.getenv("QUERY_ENGINE", "sql")
+
+SNAPSHOT_SQL = (
+    f"SELECT id, {', '.join(MERCHANT_FIELDS)} FROM merchants ORDER BY id"
+)
+
+# SQLite 的 LIKE 只对 ASCII 字母忽略大小写
+_ASCII_FOLD = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+class MerchantSnapshot:
+    # merchants 表的列式快照：机构字段用 Categorical，商户号额外保存排序后的数组用于二分查找，
+    # id 按升序排列，筛选结果的顺序与 SQL 的 ORDER BY id 一致
+
+    def __init__(self, generation: int, frame: pd.DataFrame):
+        self.generation = generation
+        self.size = len(frame)
+        self.ids = frame["id"].to_numpy(dtype=np.int64)
+        self.merchant_id = frame["merchant_id"].to_numpy(dtype=object)
+        self.merchant_name = frame["merchant_name"].to_numpy(dtype=object)
+        self.institution = pd.Categorical(frame["institution"])
+        self.institution_id = pd.Categorical(frame["institution_id"])
+        self.transaction_count = frame["transaction_count"].to_numpy(dtype=np.int64)
+
+        self._merchant_id_order = np.argsort(self.merchant_id, kind="stable")
+        self._sorted_merchant_id = self.merchant_id[self._merchant_id_order]
+        self._folded_names = pd.Series(self.merchant_name, dtype=object).str.translate(_ASCII_FOLD)
+
+    def _category_mask(self, values: pd.Categorical, value: str) -> np.ndarray:
+        try:
+            code = values.categories.get_loc(value)
+        except KeyError:
+            return np.zeros(self.size, dtype=bool)
+        return values.codes == code
+
+    def _merchant_id_mask(self, value: str) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        lo = np.searchsorted(self._sorted_merchant_id, value, side="left")
+        hi = np.searchsorted(self._sorted_merchant_id, value, side="right")
+        mask[self._merchant_id_order[lo:hi]] = True
+        return mask
+
+    def _name_mask(self, keyword: str):
+        # 关键字中含有 LIKE 通配符时无法用子串匹配表达，返回 None 退回 SQL
+        if "%" in keyword or "_" in keyword:
+            return None
+        folded = keyword.translate(_ASCII_FOLD)
+        return self._folded_names.str.contains(folded, regex=False).to_numpy(dtype=bool)
+
+    def mask(self, institution_id=None, institution=None, merchant_id=None, merchant_name=None,
+             min_transactions=None, max_transactions=None):
+        # 与 merchant_conditions 相同的语义：等值/模糊条件之间为 OR，交易笔数范围为 AND
+        conditions = []
+        if institution_id:
+            conditions.append(self._category_mask(self.institution_id, institution_id))
+        if institution:
+            conditions.append(self._category_mask(self.institution, institution))
+        if merchant_id:
+            conditions.append(self._merchant_id_mask(merchant_id))
+        if merchant_name:
+            name_mask = self._name_mask(merchant_name)
+            if name_mask is None:
+                return None
+            conditions.append(name_mask)
+
+        mask = np.logical_or.reduce(conditions) if conditions else np.ones(self.size, dtype=bool)
+        if min_transactions is not None:
+            mask &= self.transaction_count >= min_transactions
+        if max_transactions is not None:
+            mask &= self.transaction_count <= max_transactions
+        return mask
+
+    def page(self, page: int, page_size: int, last_id=None, need_total: bool = True, **filters):
+        # 返回 (items, total, next_cursor)；返回 None 表示需要退回 SQL
+        if page_size <= 0:
+            return None
+        mask = self.mask(**filters)
+        if mask is None:
+            return None
+        positions = np.flatnonzero(mask)
+        total = int(len(positions)) if need_total else None
+
+        next_cursor = None
+        if last_id is not None:
+            start = np.searchsorted(self.ids[positions], last_id, side="right")
+            selected = positions[start:start + page_size + 1]
+            if len(selected) > page_size:
+                selected = selected[:page_size]
+                next_cursor = encode_cursor(int(self.ids[selected[-1]]))
+        else:
+            # 与 SQLite 一致：负的 OFFSET 按 0 处理
+            offset = max((page - 1) * page_size, 0)
+            selected = positions[offset:offset + page_size]
+
+        columns = (
+            self.merchant_id[selected].tolist(),
+            self.merchant_name[selected].tolist(),
+            self.institution[selected].tolist(),
+            self.institution_id[selected].tolist(),
+            self.transaction_count[selected].tolist(),
+        )
+        items = [dict(zip(MERCHANT_FIELDS, row)) for row in zip(*columns)]
+        return items, total, next_cursor
+
+
+def load_snapshot(db) -> MerchantSnapshot:
+    # 读取前后数据代次一致才说明读到的是同一代数据，否则重新读取
+    while True:
+        start = time.perf_counter()
+        generation = get_generation(db)
+        rows = db.execute(text(SNAPSHOT_SQL)).fetchall()
+        if get_generation(db) == generation:
+            break
+    frame = pd.DataFrame.from_records(rows, columns=["id", *MERCHANT_FIELDS])
+    snapshot = MerchantSnapshot(generation, frame)
+    logger.info("已加载商户快照: 数据代次 %s, %s 条, 耗时 %.2fs", generation, snapshot.size, time.perf_counter() - start)
+    return snapshot
+
+
+class SnapshotEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def get(self, db, generation: int) -> MerchantSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.generation != generation:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.generation != generation:
+                    snapshot = self._snapshot = load_snapshot(db)
+        return snapshot
+
+    def refresh(self, db) -> MerchantSnapshot:
+        with self._lock:
+            self._snapshot = load_snapshot(db)
+        return self._snapshot
+
+
+snapshot_engine = SnapshotEngine()
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+# 测试直接导入 backend 目录下的模块（与服务端相同）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入 main 等模块时会按环境变量创建数据库、缓存和上传任务表，测试使用临时目录，不读写工作目录中的 merchants.db
+_test_dir = tempfile.mkdtemp(prefix="merchants-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_test_dir, 'merchants.db')}"
+os.environ["RESULT_CACHE_PATH"] = os.path.join(_test_dir, "result_cache.db")
+os.environ["UPLOAD_JOBS_PATH"] = os.path.join(_test_dir, "upload_jobs.db")
+
+
+def make_frame(merchant_ids, names=None, institution="杨庄", institution_id="3411463930", counts=None):
+    # 与上传的 Excel 相同的列名
+    merchant_ids = [str(merchant_id) for merchant_id in merchant_ids]
+    return pd.DataFrame({
+        "商户号": merchant_ids,
+        "商户名称": names or [f"宿州市理发店{merchant_id}" for merchant_id in merchant_ids],
+        "机构": [institution] * len(merchant_ids),
+        "机构号": [institution_id] * len(merchant_ids),
+        "有效交易笔数": counts or [1] * len(merchant_ids),
+    })
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "merchants.db"))
+    yield conn
+    conn.close()
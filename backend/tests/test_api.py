@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from cache import result_cache
+from conftest import make_frame
+from ingest import load_dataframe
+
+
+@pytest.fixture
+def client():
+    raw_conn = main.engine.raw_connection()
+    try:
+        load_dataframe(raw_conn, make_frame(range(25)), mode="swap")
+    finally:
+        raw_conn.close()
+    result_cache.clear()
+    # 不进入 with：关闭事件会关掉共用的线程池，影响后面的用例
+    return TestClient(main.app)
+
+
+def test_cursor_first_page_is_cached_separately(client):
+    offset = client.get("/api/merchants/", params={"page": 1, "page_size": 10}).json()
+    assert offset["next_cursor"] is None
+
+    # cursor="" 是游标分页的第一页，不能命中偏移分页第 1 页的缓存
+    first = client.get("/api/merchants/", params={"cursor": "", "page_size": 10}).json()
+    assert first["next_cursor"] is not None
+    assert [item["merchant_id"] for item in first["items"]] == [item["merchant_id"] for item in offset["items"]]
+
+    # 反过来，偏移分页也不会拿到游标分页的缓存结果
+    assert client.get("/api/merchants/", params={"page": 1, "page_size": 10}).json()["next_cursor"] is None
+
+
+def test_cursor_pages_skip_total_unless_requested(client):
+    assert client.get("/api/merchants/", params={"page": 1}).json()["total"] == 25
+    assert client.get("/api/merchants/", params={"cursor": ""}).json()["total"] is None
+    page = client.get("/api/merchants/", params={"cursor": "", "include_total": "true"}).json()
+    assert (page["total"], page["total_pages"]) == (25, 3)
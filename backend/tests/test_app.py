@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+
+from app import main as app_main
+from cache import result_cache
+from conftest import make_frame
+from ingest import load_dataframe
+from models import engine
+
+
+def load(frame, data_date=None):
+    raw_conn = engine.raw_connection()
+    try:
+        load_dataframe(raw_conn, frame, mode="swap", data_date=data_date)
+    finally:
+        raw_conn.close()
+    result_cache.clear()
+
+
+# 不进入 with：关闭事件会关掉共用的线程池，影响后面的用例
+client = TestClient(app_main.app)
+
+
+def test_default_admin_can_log_in():
+    response = client.post("/token", data={"username": "admin", "password": "admin"})
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+
+def test_data_date_comes_from_loaded_data():
+    load(make_frame(range(3)))
+    assert client.get("/api/merchants/").json()["data_date"] == ""
+
+    load(make_frame(range(3)), data_date="5月1日")
+    assert client.get("/api/merchants/").json()["data_date"] == "5月1日"
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from conftest import make_frame
+from ingest import IngestError, load_dataframe, rollback_generation
+
+
+def data_date(conn):
+    return conn.execute("SELECT date FROM data_date WHERE id = 1").fetchone()[0]
+
+
+def test_rollback_restores_data_date(conn):
+    load_dataframe(conn, make_frame(range(3)), mode="swap", data_date="4月27日")
+    load_dataframe(conn, make_frame(range(5)), mode="swap", data_date="5月1日")
+    assert data_date(conn) == "5月1日"
+
+    rollback_generation(conn)
+    assert conn.execute("SELECT COUNT(*) FROM merchants").fetchone()[0] == 3
+    assert data_date(conn) == "4月27日"
+
+    # 再次回滚换回较新的数据和日期
+    rollback_generation(conn)
+    assert conn.execute("SELECT COUNT(*) FROM merchants").fetchone()[0] == 5
+    assert data_date(conn) == "5月1日"
+
+
+def test_rollback_to_upload_without_date(conn):
+    load_dataframe(conn, make_frame(range(3)), mode="swap")
+    load_dataframe(conn, make_frame(range(5)), mode="swap", data_date="5月1日")
+    rollback_generation(conn)
+    assert data_date(conn) is None
+
+
+
+def merchant_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM merchants").fetchone()[0]
+
+
+def test_swap_fails_when_staging_table_disappears(conn, tmp_path):
+    load_dataframe(conn, make_frame(range(3)), mode="swap")
+
+    # 模拟另一个 worker 在影子表写完、替换之前删掉了 merchants_next
+    def progress(phase, rows):
+        if phase == "swapping":
+            other = sqlite3.connect(str(tmp_path / "merchants.db"))
+            other.execute("DROP TABLE merchants_next")
+            other.commit()
+            other.close()
+
+    with pytest.raises(IngestError):
+        load_dataframe(conn, make_frame(range(5)), mode="swap", progress=progress)
+    assert merchant_count(conn) == 3
+
+
+def test_rollback_keeps_concurrent_staging_table(conn):
+    load_dataframe(conn, make_frame(range(3)), mode="swap")
+    load_dataframe(conn, make_frame(range(5)), mode="swap")
+    # 并发上传已写好的影子表不能被回滚删掉
+    conn.execute("CREATE TABLE merchants_next (id INTEGER PRIMARY KEY, merchant_id VARCHAR)")
+    conn.commit()
+
+    rollback_generation(conn)
+    assert merchant_count(conn) == 3
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'merchants_next'").fetchone() is not None
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'merchants_rollback%'").fetchone() is None
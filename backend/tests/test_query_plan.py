@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from conftest import make_frame
+from diagnostics import explain_query_plan
+from ingest import load_dataframe
+from models import Merchant
+from queries import merchant_conditions, merchant_select
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'merchants.db'}")
+    frame = make_frame(range(2000), counts=[i % 100 for i in range(2000)])
+    raw_conn = engine.raw_connection()
+    try:
+        load_dataframe(raw_conn, frame, mode="swap")
+    finally:
+        raw_conn.close()
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def page_plan(db, **filters):
+    statement = merchant_select(merchant_conditions(**filters)).order_by(Merchant.id).offset(20).limit(10)
+    return explain_query_plan(db, statement)
+
+
+def count_plan(db, **filters):
+    statement = select(func.count()).select_from(merchant_select(merchant_conditions(**filters)).subquery())
+    return explain_query_plan(db, statement)
+
+
+def assert_uses_index(plan, index):
+    assert not any(step.startswith("SCAN merchants") for step in plan), plan
+    assert any(step.startswith("SEARCH merchants USING") and f"INDEX ix_merchants_g1_{index} " in step for step in plan), plan
+
+
+@pytest.mark.parametrize("filters, index", [
+    ({"institution_id": "3411463930"}, "institution_id_tx"),
+    ({"institution": "杨庄"}, "institution_tx"),
+    ({"institution_id": "3411463930", "max_transactions": 3}, "institution_id_tx"),
+    ({"institution": "杨庄", "min_transactions": 10, "max_transactions": 20}, "institution_tx"),
+])
+def test_single_condition_uses_composite_index(db, filters, index):
+    assert_uses_index(page_plan(db, **filters), index)
+    assert_uses_index(count_plan(db, **filters), index)
+
+
+def test_transaction_range_count_uses_index(db):
+    # 只按交易笔数筛选时，分页查询按 id 顺序扫描、取满一页即停止；统计总数走 transaction_count 索引
+    assert_uses_index(count_plan(db, max_transactions=3), "transaction_count")
+
+
+def test_or_conditions_use_union_of_index_searches(db):
+    filters = {"institution_id": "3411463930", "institution": "杨庄", "max_transactions": 3}
+    for plan in (page_plan(db, **filters), count_plan(db, **filters)):
+        assert "UNION USING TEMP B-TREE" in plan, plan
+        assert_uses_index(plan, "institution_id_tx")
+        assert_uses_index(plan, "institution_tx")
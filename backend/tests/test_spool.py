@@ -0,0 +1,25 @@
+import asyncio
+import os
+
+import pytest
+
+from ingest import spool_upload
+
+
+class BrokenUpload:
+    # 读到第二块时失败的上传文件
+    def __init__(self):
+        self.reads = 0
+
+    async def read(self, size):
+        self.reads += 1
+        if self.reads > 1:
+            raise ConnectionError("client disconnected")
+        return b"x" * 10
+
+
+def test_spool_upload_removes_partial_file(tmp_path):
+    dest = str(tmp_path / "upload.xlsx")
+    with pytest.raises(ConnectionError):
+        asyncio.run(spool_upload(BrokenUpload(), dest))
+    assert not os.path.exists(dest)
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import uuid
+
+import pytest
+
+from conftest import make_frame
+from ingest import MERCHANT_FIELDS, load_dataframe, rollback_generation
+from storage import PostgresStorage, Storage, storage_for
+
+# 同一组用例分别在 SQLite 和 PostgreSQL 上执行；
+# 设置 TEST_POSTGRES_URL（如 postgresql://postgres@localhost/test）时才运行 PostgreSQL，否则跳过
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def db(request, tmp_path):
+    if request.param == "sqlite":
+        conn = sqlite3.connect(str(tmp_path / "merchants.db"))
+        yield conn
+        conn.close()
+        return
+
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    psycopg2 = pytest.importorskip("psycopg2")
+    # 每个用例使用独立的 schema，结束后删除
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    conn = psycopg2.connect(TEST_POSTGRES_URL)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    cursor.execute(f"SET search_path TO {schema}")
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        cursor = conn.cursor()
+        cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+def query(conn, statement, params=(), fetch=True):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(storage_for(conn).sql(statement), params)
+        return cursor.fetchall() if fetch else None
+    finally:
+        cursor.close()
+
+
+def merchant_names(conn):
+    return dict(query(conn, "SELECT merchant_id, merchant_name FROM merchants"))
+
+
+def test_storage_for(db):
+    storage = storage_for(db)
+    expected = PostgresStorage if "psycopg" in type(db).__module__ else Storage
+    assert type(storage) is expected
+
+
+def test_tables_and_indexes(db):
+    storage = storage_for(db)
+    cursor = db.cursor()
+    storage.create_temp_merchants(cursor, "merchants_delta")
+    storage.create_index(cursor, "ix_merchants_delta_merchant_id", "merchants_delta", ("merchant_id",), temp=True)
+    rows = [(f"m{i}", f"商户{i}", "杨庄", "3411463930", i) for i in range(3)]
+    assert storage.write_rows(cursor, storage.temp_table("merchants_delta"), MERCHANT_FIELDS, rows) == 3
+    db.commit()
+
+    assert query(db, "SELECT COUNT(*) FROM merchants_delta") == [(3,)]
+    assert not storage.table_exists(cursor, "merchants")
+    cursor.execute(storage.merchants_ddl("merchants"))
+    storage.create_index(cursor, "ix_merchants_institution", "merchants", ("institution_id", "transaction_count"))
+    db.commit()
+    assert storage.table_exists(cursor, "merchants")
+    assert ("institution_id", "transaction_count") in storage.index_columns(cursor, "merchants")
+    cursor.close()
+
+
+def test_distinct_treats_null_as_value(db):
+    distinct = storage_for(db).distinct
+    rows = query(
+        db,
+        f"SELECT {distinct('a', 'b')} FROM "
+        f"(SELECT CAST(NULL AS INTEGER) AS a, CAST(NULL AS INTEGER) AS b UNION ALL SELECT 1, NULL) t",
+    )
+    assert [bool(row[0]) for row in rows] == [False, True]
+
+
+def test_swap_load_and_rollback(db):
+    load_dataframe(db, make_frame(["m0", "m1"]), mode="swap", data_date="4月27日")
+    load_dataframe(db, make_frame(["m0", "m1", "m2"]), mode="swap", data_date="5月1日")
+    assert len(merchant_names(db)) == 3
+
+    rollback_generation(db)
+    assert set(merchant_names(db)) == {"m0", "m1"}
+    assert query(db, "SELECT date FROM data_date WHERE id = 1") == [("4月27日",)]
+
+
+@pytest.mark.parametrize("search_index", [True, False])
+def test_delta_load_keeps_last_duplicate(db, search_index):
+    if search_index and storage_for(db).name != "sqlite":
+        pytest.skip("FTS5 full-text index is SQLite only")
+    load_dataframe(db, make_frame(["m0", "m1", "m2"]), mode="swap")
+    if not search_index:
+        query(db, "DROP TABLE IF EXISTS merchants_fts", fetch=False)
+        db.commit()
+
+    # m1 出现两次，以最后一条为准；m3 重复两次只算一条新增
+    frame = make_frame(["m1", "m1", "m2", "m3", "m3"], names=["旧名", "新名", "宿州市理发店m2", "甲", "乙"])
+    stats = load_dataframe(db, frame, mode="delta")
+
+    assert (stats.inserted, stats.updated, stats.deleted) == (1, 1, 1)
+    assert merchant_names(db) == {"m1": "新名", "m2": "宿州市理发店m2", "m3": "乙"}
+    if search_index:
+        # 全文索引的 rowid 与 merchants.id 一一对应
+        rows = query(db, "SELECT rowid, merchant_name FROM merchants_fts ORDER BY rowid")
+        assert rows == query(db, "SELECT id, merchant_name FROM merchants ORDER BY id")
+
+    # 再次导入相同数据不产生任何变化
+    stats = load_dataframe(db, frame, mode="delta")
+    assert (stats.inserted, stats.updated, stats.deleted) == (0, 0, 0)
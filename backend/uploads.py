@@ -0,0 +1,96 @@
+import logging
+import time
+from typing import List, Optional
+
+from aggregates import refresh_institution_summary
+from batch_ingest import list_sources, load_batch
+from cache import data_date_cache
+from diagnostics import table_summary
+from history import archive_partition
+from ingest import INGEST_CHUNK_SIZE, INGEST_MODE, load_excel
+from metrics import observe_phase
+from models import ReadSessionLocal, check_db_connection, engine
+from snapshot import QUERY_ENGINE, snapshot_engine
+
+logger = logging.getLogger(__name__)
+
+# 上传数据的导入流程，两个服务共用：写入影子表后原子替换，然后更新数据日期、历史分区、机构汇总表和快照。
+# 都是同步操作，由调用方放到 ingest 线程池执行
+
+
+# 上传的同步部分（Excel 解析、批量写入并更新数据日期、统计摘要/快照刷新），
+# progress 用于汇报进度和响应取消
+def ingest_upload(spool_path: str, formatted_date: Optional[str], mode: str = INGEST_MODE, progress=None):
+    raw_conn = engine.raw_connection()
+    try:
+        stats = load_excel(raw_conn, spool_path, INGEST_CHUNK_SIZE, mode, progress, formatted_date)
+    finally:
+        raw_conn.close()
+    finish_upload(stats, formatted_date, progress)
+    return stats
+
+
+# 批量导入：多个文件/工作表在子进程中并行解析，按商户号去重后一次性原子替换
+def ingest_batch(files: List[tuple], sheets: Optional[List[str]], formatted_date: Optional[str], progress=None):
+    raw_conn = engine.raw_connection()
+    try:
+        stats = load_batch(
+            raw_conn, list_sources(files, sheets), chunk_size=INGEST_CHUNK_SIZE, progress=progress,
+            data_date=formatted_date,
+        )
+    finally:
+        raw_conn.close()
+    finish_upload(stats, formatted_date, progress)
+    return stats
+
+
+# 新数据生效后的收尾：更新数据日期、保存历史分区、更新表统计摘要和列式快照
+def finish_upload(stats, formatted_date: Optional[str], progress=None):
+    success_count = stats.rows
+    if progress is not None:
+        progress("finalizing", success_count)
+
+    # 数据日期已与新数据在同一事务中写入，这里只更新本进程的缓存
+    if formatted_date:
+        data_date_cache.publish(stats.generation, formatted_date)
+    else:
+        logger.info("没有解析出日期，不更新数据日期")
+
+    # 按数据日期保存历史分区（没有数据日期的上传不保存），失败不影响本次上传
+    if formatted_date:
+        if progress is not None:
+            progress("archiving", success_count)
+        start = time.perf_counter()
+        raw_conn = engine.raw_connection()
+        try:
+            archive_partition(raw_conn, formatted_date, stats.generation)
+        except Exception as e:
+            logger.error("保存历史分区失败: %s", e)
+        finally:
+            raw_conn.close()
+        observe_phase("archive", time.perf_counter() - start)
+
+    # 重新计算机构汇总表；失败时由 /api/institutions/summary 按数据代次补算
+    if progress is not None:
+        progress("aggregating", success_count)
+    start = time.perf_counter()
+    raw_conn = engine.raw_connection()
+    try:
+        refresh_institution_summary(raw_conn, stats.generation)
+    except Exception as e:
+        logger.error("更新机构汇总表失败: %s", e)
+    finally:
+        raw_conn.close()
+    observe_phase("aggregate", time.perf_counter() - start)
+
+    # 数据已替换，重新计算表统计摘要，并预先加载新的列式快照
+    start = time.perf_counter()
+    with ReadSessionLocal() as db:
+        table_summary.refresh(db)
+        if QUERY_ENGINE == "snapshot":
+            snapshot_engine.refresh(db)
+    observe_phase("summary", time.perf_counter() - start)
+    logger.info("成功上传 %s 条记录", success_count)
+
+    # 验证数据是否成功写入
+    check_db_connection()
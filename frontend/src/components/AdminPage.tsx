@@ -19,7 +19,7 @@ const AdminPage: React.FC = () => {
           'Content-Type': 'multipart/form-data',
         },
       });
-      message.success('文件上传成功');
+      message.success(`文件已上传，正在后台导入（任务号 ${response.data.job_id}）`);
       navigate('/');
     } catch (error) {
       console.error('Upload error:', error);
@@ -2,7 +2,6 @@ import React, { useState, useEffect } from 'react';
 import { Input, Table, Button, Space, Card, Tabs, message, Upload, Modal, Form } from 'antd';
 import { SearchOutlined, DownloadOutlined, UploadOutlined } from '@ant-design/icons';
 import axios from 'axios';
-import * as XLSX from 'xlsx';
 import { TablePaginationConfig } from 'antd/es/table';
 
 const { Search } = Input;
@@ -128,6 +127,18 @@ const SearchPage: React.FC = () => {
     message.success('已登出');
   };
 
+  // 查询上传任务进度
+  const waitForUploadJob = async (jobId: string) => {
+    while (true) {
+      const { data } = await axios.get(`https://www.mimih2o.top/api/upload/${jobId}`);
+      if (['succeeded', 'failed', 'cancelled'].includes(data.status)) {
+        return data;
+      }
+      console.log(`上传任务 ${jobId}: ${data.phase}, 已处理 ${data.rows} 条`);
+      await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+  };
+
   // 处理文件上传
   const handleUpload = async (file: File) => {
     try {
@@ -135,7 +146,15 @@ const SearchPage: React.FC = () => {
       formData.append('file', file);
       
       const response = await axios.post('https://www.mimih2o.top/api/upload/', formData);
-      message.success('文件上传成功');
+      message.info('文件已上传，正在后台导入');
+      
+      // 轮询上传任务，直到导入完成、失败或被取消
+      const job = await waitForUploadJob(response.data.job_id);
+      if (job.status !== 'succeeded') {
+        message.error(job.error ? `导入失败: ${job.error}` : '导入已取消');
+        return false;
+      }
+      message.success(`文件导入成功，共 ${job.rows} 条记录`);
       
       // 更新数据日期
       if (response.data.data_date && response.data.data_date !== "未更新") {
@@ -287,19 +306,37 @@ const SearchPage: React.FC = () => {
     }));
   };
 
-  const handleExport = () => {
-    const data = merchants.map(merchant => ({
-      '商户号': merchant.merchant_id,
-      '商户名称': merchant.merchant_name,
-      '机构': merchant.institution,
-      '机构号': merchant.institution_id,
-      '有效交易笔数': merchant.transaction_count,
-    }));
+  // 由后端按当前查询条件流式生成Excel，不受分页条数限制
+  const handleExport = async () => {
+    const params: any = { format: 'xlsx' };
+    if (searchType === 'institution') {
+      params.institution_id = searchValue;
+      params.institution = searchValue;
+    } else {
+      params.merchant_id = searchValue;
+      params.merchant_name = searchValue;
+    }
+    if (showLessThan10) {
+      params.max_transactions = 9;
+    }
 
-    const ws = XLSX.utils.json_to_sheet(data);
-    const wb = XLSX.utils.book_new();
-    XLSX.utils.book_append_sheet(wb, ws, '商户数据');
-    XLSX.writeFile(wb, '商户数据.xlsx');
+    try {
+      const response = await axios.get('https://www.mimih2o.top/api/merchants/export', {
+        params,
+        responseType: 'blob',
+      });
+      const url = window.URL.createObjectURL(new Blob([response.data]));
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = '商户数据.xlsx';
+      document.body.appendChild(link);
+      link.click();
+      link.remove();
+      window.URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error('Export error:', error);
+      message.error('导出失败，请稍后重试');
+    }
   };
 
   // 处理筛选按钮点击